@@ -2,23 +2,61 @@
 
 import pygame
 AUDIO_DONE = pygame.USEREVENT
+GAPLESS_CACHE_SIZE = 16*1024*1024
 
 class Audio:
-    def __init__(self, audio):
-        rate = audio.sample_rate
-        pygame.mixer.init(rate, -16, 0)
-        self.clips = [make_sound(rate, clip.samples) for clip in audio.clips]
-        [self.queue, self.playing] = [[], 0]
+    def __init__(self, audio, cache_size=None, gapless=0):
+        self.rate = audio.sample_rate
+        pygame.mixer.init(self.rate, -16, 0)
+        self.samples = [clip.samples for clip in audio.clips]
+        if gapless and cache_size == None:
+            cache_size = GAPLESS_CACHE_SIZE
+        [self.clips, self.cache, self.cache_size] = [{}, [], cache_size]
+        [self.queue, self.playing, self.size] = [[], 0, 0]
+        self.gapless = gapless
 
     def play(self, clip_i):
         self.queue.append(clip_i)
-        if not self.playing:
+        if self.gapless:
+            if not self.playing:
+                self.playing = 1
+                pygame.event.post(pygame.event.Event(AUDIO_DONE))
+        elif not self.playing:
             self.next()
+        else:
+            self.prefetch(clip_i)
 
     def next(self):
         self.playing = len(self.queue)
         if len(self.queue):
-            self.clips[self.queue.pop(0)].play().set_endevent(AUDIO_DONE)
+            if self.gapless:
+                [key, self.queue] = [tuple(self.queue), []]
+            else:
+                key = (self.queue.pop(0),)
+            self.get(key).play().set_endevent(AUDIO_DONE)
+
+    def prefetch(self, clip_i):
+        if not self.gapless:
+            self.get((clip_i,))
+
+    def get(self, key):
+        if key in self.clips:
+            self.cache.remove(key)
+        else:
+            data = "".join([str(self.samples[clip_i]) for clip_i in key])
+            self.clips[key] = make_sound(self.rate, data)
+            self.size = self.size + len(data)
+        self.cache.append(key)
+        while self.cache_size != None and self.size > self.cache_size:
+            if len(self.cache) == 1:
+                break
+            old_key = self.cache.pop(0)
+            self.size = self.size - self.length(old_key)
+            del self.clips[old_key]
+        return self.clips[key]
+
+    def length(self, key):
+        return sum([len(self.samples[clip_i]) for clip_i in key])
 
     def stop(self):
         self.queue = []
@@ -27,8 +65,8 @@ class Audio:
 def make_sound(rate, data):
     [comp_channels, sample_size] = ["\x01\x00\x01\x00", "\x02\x00\x10\x00"]
     fmt = comp_channels + put_int(rate) + put_int(rate*2) + sample_size
-    file = chunk("RIFF", "WAVE" + chunk("fmt ", fmt) + chunk("data", data))
-    return pygame.mixer.Sound(Buffer(file))
+    data = "WAVE" + chunk("fmt ", fmt) + chunk("data", data)
+    return pygame.mixer.Sound(Buffer(chunk("RIFF", data)))
 
 def chunk(type, contents):
     return type + put_int(len(contents)) + contents
@@ -1,11 +1,13 @@
 # $Id: Ballot.py,v 1.26 2007/03/28 22:36:28 ping Exp $
 
-import sha
+import sha, mmap, zlib
 
 class Ballot:
     def __init__(self, stream):
-        assert stream.read(8) == "Pvote\x00\x01\x00"
+        header = stream.read(8)
+        assert header in ["Pvote\x00\x01\x00", "Pvote\x00\x02\x00"]
         [self.stream, self.sha] = [stream, sha.sha()]
+        self.version = ord(header[6])
         self.model = Model(self)
         self.text = Text(self)
         self.audio = Audio(self)
@@ -17,6 +19,24 @@ class Ballot:
         self.sha.update(data)
         return data
 
+    def view(self, length):
+        data = getattr(self.stream, "view", self.stream.read)(length)
+        self.sha.update(data)
+        return data
+
+class MappedFile:
+    def __init__(self, file):
+        self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.pos = 0
+
+    def read(self, length):
+        return str(self.view(length))
+
+    def view(self, length):
+        length = min(length, len(self.map) - self.pos)
+        self.pos = self.pos + length
+        return buffer(self.map, self.pos - length, length)
+
 class Model:
     def __init__(self, stream):
         self.groups = get_list(stream, Group)
@@ -116,7 +136,7 @@ class Audio:
 
 class Clip:
     def __init__(self, stream):
-        self.samples = stream.read(get_int(stream, 0)*2)
+        self.samples = get_data(stream, get_int(stream, 0)*2)
 
 class Video:
     def __init__(self, stream):
@@ -135,7 +155,7 @@ class Image:
     def __init__(self, stream):
         self.width = get_int(stream, 0)
         self.height = get_int(stream, 0)
-        self.pixels = stream.read(self.width*self.height*3)
+        self.pixels = get_data(stream, self.width*self.height*3)
 
 class Rect:
     def __init__(self, stream):
@@ -163,3 +183,13 @@ def get_str(stream):
 
 def get_list(stream, Class):
     return [Class(stream) for i in range(get_int(stream, 0))]
+
+def get_data(stream, length):
+    if stream.version > 1 and get_enum(stream, 2):
+        assert length > 0
+        inflater = zlib.decompressobj()
+        data = inflater.decompress(stream.read(get_int(stream, 0)), length)
+        assert len(data) == length and inflater.unconsumed_tail == ""
+        assert inflater.flush() == "" and inflater.unused_data == ""
+        return data
+    return stream.view(length)
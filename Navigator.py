@@ -1,3 +1,5 @@
+from SlotMap import SlotMap
+
 [OP_ADD, OP_REMOVE, OP_APPEND, OP_POP, OP_CLEAR] = range(5)
 [SG_CLIP, SG_OPTION, SG_LIST_SELS, SG_COUNT_SELS, SG_MAX_SELS] = range(5)
 [PR_GROUP_EMPTY, PR_GROUP_FULL, PR_OPTION_SELECTED] = range(3)
@@ -6,7 +8,16 @@ class Navigator:
     def __init__(self, model, audio, video, printer):
         self.model = model
         [self.audio, self.video, self.printer] = [audio, video, printer]
-        self.selections = [[] for group in model.groups]
+        [self.keys, self.targets] = [[], []]
+        self.slots = [SlotMap(page, model.groups) for page in model.pages]
+        for page in model.pages:
+            lists = [state.bindings + page.bindings for state in page.states]
+            self.keys.append([dispatch(b, "key") for b in lists])
+            self.targets.append([dispatch(b, "target_i") for b in lists])
+        self.reset()
+
+    def reset(self):
+        self.selections = [Selection() for group in self.model.groups]
         self.page_i = None
         self.goto(0, 0)
 
@@ -17,50 +28,52 @@ class Navigator:
             [self.page_i, self.page] = [page_i, self.model.pages[page_i]]
             [self.state_i, self.state] = [state_i, self.page.states[state_i]]
             self.play(self.state.segments)
+            self.prefetch(self.state.timeout_segments)
         self.update()
 
     def update(self):
-        self.video.goto(self.page_i)
-        self.video.paste(self.state.sprite_i, self.state_i)
+        self.video.goto(self.page_i, self.state.sprite_i, self.state_i)
+        slots = self.slots[self.page_i]
 
-        slot_i = len(self.page.states) 
-        for area in self.page.option_areas:
+        for [area, slot_i] in zip(self.page.option_areas, slots.options):
             unselected = area.option_i not in self.selections[area.group_i]
             group = self.model.groups[area.group_i]
             option = group.options[area.option_i]
             self.video.paste(option.sprite_i + unselected, slot_i)
-            slot_i = slot_i + 1
 
-        for area in self.page.counter_areas:
+        for [area, slot_i] in zip(self.page.counter_areas, slots.counters):
             count = len(self.selections[area.group_i])
             self.video.paste(area.sprite_i + count, slot_i)
-            slot_i = slot_i + 1
 
-        for area in self.page.review_areas:
-            slot_i = self.review(area.group_i, slot_i, area.cursor_sprite_i)
+        for [area, positions] in zip(self.page.review_areas, slots.reviews):
+            self.review(area.group_i, positions, area.cursor_sprite_i)
 
-    def review(self, group_i, slot_i, cursor_sprite_i):
+    def review(self, group_i, positions, cursor_sprite_i):
         group = self.model.groups[group_i]
         selections = self.selections[group_i]
-        for i in range(group.max_sels):
+        for [i, [slot_i, char_slots]] in enumerate(positions):
             if i < len(selections):
                 option = group.options[selections[i]]
                 self.video.paste(option.sprite_i, slot_i)
                 if option.writein_group_i != None:
-                    self.review(option.writein_group_i, slot_i + 1, None)
+                    writein_group = self.model.groups[option.writein_group_i]
+                    chars = self.selections[option.writein_group_i]
+                    for [char_slot_i, option_i] in zip(char_slots, chars):
+                        char = writein_group.options[option_i]
+                        self.video.paste(char.sprite_i, char_slot_i)
             if i == len(selections) and cursor_sprite_i != None:
                 self.video.paste(cursor_sprite_i, slot_i)
-            slot_i = slot_i + 1 + group.max_chars
-        return slot_i
 
     def press(self, key):
-        for binding in self.state.bindings + self.page.bindings:
-            if key == binding.key and self.test(binding.conditions):
+        table = self.keys[self.page_i][self.state_i]
+        for binding in table.get(key, ()):
+            if self.test(binding.conditions):
                 return self.invoke(binding)
 
     def touch(self, target_i):
-        for binding in self.state.bindings + self.page.bindings:
-            if target_i == binding.target_i and self.test(binding.conditions):
+        table = self.targets[self.page_i][self.state_i]
+        for binding in table.get(target_i, ()):
+            if self.test(binding.conditions):
                 return self.invoke(binding)
 
     def test(self, conditions):
@@ -99,7 +112,7 @@ class Navigator:
         if step.op == OP_POP and len(selections) > 0:
             selections.pop()
         if step.op == OP_CLEAR:
-            self.selections[group_i] = []
+            self.selections[group_i] = Selection()
 
     def timeout(self):
         self.play(self.state.timeout_segments)
@@ -125,6 +138,11 @@ class Navigator:
                 if segment.type == SG_MAX_SELS:
                     self.audio.play(segment.clip_i + group.max_sels)
 
+    def prefetch(self, segments):
+        for segment in segments:
+            if segment.type == SG_CLIP:
+                self.audio.prefetch(segment.clip_i)
+
     def play_option(self, option, offset):
         self.audio.play(option.clip_i + offset)
         if option.writein_group_i != None:
@@ -137,3 +155,42 @@ class Navigator:
             area = self.page.option_areas[object.option_i]
             return [area.group_i, area.option_i]
         return [object.group_i, object.option_i]
+
+class Selection:
+    def __init__(self):
+        [self.list, self.mask] = [[], 0]
+
+    def __len__(self):
+        return len(self.list)
+
+    def __iter__(self):
+        return iter(self.list)
+
+    def __getitem__(self, i):
+        return self.list[i]
+
+    def __contains__(self, option_i):
+        return self.mask >> option_i & 1
+
+    def append(self, option_i):
+        self.list.append(option_i)
+        self.mask = self.mask | 1 << option_i
+
+    def remove(self, option_i):
+        self.list.remove(option_i)
+        self.forget(option_i)
+
+    def pop(self):
+        option_i = self.list.pop()
+        self.forget(option_i)
+        return option_i
+
+    def forget(self, option_i):
+        if option_i not in self.list:
+            self.mask = self.mask & ~(1 << option_i)
+
+def dispatch(bindings, name):
+    table = {}
+    for binding in bindings:
+        table.setdefault(getattr(binding, name), []).append(binding)
+    return table
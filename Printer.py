@@ -1,28 +1,121 @@
 # $Id: Printer.py,v 1.9 2007/03/28 22:36:28 ping Exp $
 
+import json, os, sha, struct, sys
+
 class Printer:
-    def __init__(self, text):
-        self.text = text
+    def __init__(self, text, sink=None):
+        if sink == None:
+            sink = TextSink(sys.stdout)
+        [self.text, self.sink] = [text, sink]
 
     def write(self, selections):
+        self.sink.write(self.text, selections)
+
+    def close(self):
+        self.sink.close()
+
+class Sink:
+    def __init__(self, file, batch=1, sync=0):
+        [self.file, self.batch, self.sync] = [file, batch, sync]
+        self.pending = []
+
+    def write(self, text, selections):
+        self.pending.append(self.format(text, selections))
+        if self.sync or len(self.pending) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        self.file.write("".join(self.pending))
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        if self.file != sys.stdout:
+            self.file.close()
+
+class TextSink(Sink):
+    def format(self, text, selections):
+        lines = []
         for [group_i, selection] in enumerate(selections):
-            group = self.text.groups[group_i]
+            group = text.groups[group_i]
             if group.writein:
                 if len(selection):
-                    print "\n+ " + group.name
+                    lines.append("\n+ " + group.name)
                     line = ""
                     for option_i in selection:
                         if len(line) + len(group.options[option_i]) + 1 > 60:
-                            print "= " + line
+                            lines.append("= " + line)
                             line = ""
                         line = line + group.options[option_i] + "~"
-                    print "= " + line
+                    lines.append("= " + line)
             else:
                 if len(selection):
-                    print "\n* " + group.name
-                    for [option_i, option] in enumerate(group.options):
-                        if option_i in selection:
-                            print "- " + option
+                    lines.append("\n* " + group.name)
+                    for option_i in sorted(set(selection)):
+                        lines.append("- " + group.options[option_i])
                 else:
-                    print "\n* " + group.name + " ~ NO SELECTION"
-        print "\n~\f"
+                    lines.append("\n* " + group.name + " ~ NO SELECTION")
+        lines.append("\n~\f")
+        return "".join([line + "\n" for line in lines])
+
+class JsonSink(Sink):
+    def format(self, text, selections):
+        record = [list(selection) for selection in selections]
+        return json.dumps(record, separators=(",", ":")) + "\n"
+
+class RecordSink(Sink):
+    def __init__(self, filename, batch=1, sync=0):
+        Sink.__init__(self, open(filename, "ab"), batch, sync)
+        self.index = open(filename + ".index", "ab")
+        size = os.path.getsize(filename + ".index")
+        self.index.truncate(size - size % INDEX_ENTRY)
+        [self.offset, self.entries] = [os.path.getsize(filename), []]
+
+    def format(self, text, selections):
+        data = put_int(len(selections))
+        for selection in selections:
+            data = data + put_int(len(selection))
+            data = data + "".join([put_int(i) for i in selection])
+        entry = struct.pack(">QI", self.offset, len(data))
+        self.entries.append(entry + sha.sha(data).digest())
+        self.offset = self.offset + len(data)
+        return data
+
+    def flush(self):
+        Sink.flush(self)
+        self.index.write("".join(self.entries))
+        self.index.flush()
+        if self.sync:
+            os.fsync(self.index.fileno())
+        self.entries = []
+
+    def close(self):
+        Sink.close(self)
+        self.index.close()
+
+def put_int(n):
+    return struct.pack(">I", n)
+
+def read_records(filename):
+    data = open(filename, "rb").read()
+    index = open(filename + ".index", "rb").read()
+    records = []
+    for start in range(0, len(index) - INDEX_ENTRY + 1, INDEX_ENTRY):
+        entry = index[start:start + INDEX_ENTRY]
+        [offset, length] = struct.unpack(">QI", entry[:12])
+        record = data[offset:offset + length]
+        assert len(record) == length
+        assert sha.sha(record).digest() == entry[12:]
+        ints = struct.unpack(">%dI" % (length/4), record)
+        [selections, i] = [[], 1]
+        for group_i in range(ints[0]):
+            selections.append(list(ints[i + 1:i + 1 + ints[i]]))
+            i = i + 1 + ints[i]
+        assert i == len(ints)
+        records.append(selections)
+    return records
+
+INDEX_ENTRY = 32
@@ -0,0 +1,19 @@
+class SlotMap:
+    def __init__(self, page, groups):
+        slot_i = len(page.states)
+        [self.options, self.counters, self.reviews] = [[], [], []]
+        for area in page.option_areas:
+            self.options.append(slot_i)
+            slot_i = slot_i + 1
+        for area in page.counter_areas:
+            self.counters.append(slot_i)
+            slot_i = slot_i + 1
+        for area in page.review_areas:
+            group = groups[area.group_i]
+            positions = []
+            for i in range(group.max_sels):
+                chars = range(slot_i + 1, slot_i + 1 + group.max_chars)
+                positions.append([slot_i, chars])
+                slot_i = slot_i + 1 + group.max_chars
+            self.reviews.append(positions)
+        self.count = slot_i
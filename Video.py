@@ -1,29 +1,173 @@
 # $Id: Video.py,v 1.5 2007/03/12 12:29:38 ping Exp $
 
-import pygame
+import pygame, marshal
+
+CELL = 32
+ATLAS_SIZE = 2048
 
 def make_image(im):
-    return pygame.image.fromstring(im.pixels, (im.width, im.height), "RGB")
+    size = (im.width, im.height)
+    return pygame.image.fromstring(str(im.pixels), size, "RGB")
+
+def make_atlas(sprites, cache=None, digest=None):
+    [key, entry] = [None, None]
+    if cache != None:
+        assert digest != None
+        try:
+            file = open(cache, "rb")
+            [key, entry] = marshal.load(file)
+            file.close()
+        except (IOError, EOFError, ValueError, TypeError):
+            pass
+    if key != digest or entry == None or len(entry[1]) != len(sprites):
+        entry = None
+    if entry != None:
+        [sizes, areas, pixels] = entry
+        atlases = [pygame.image.fromstring(data, size, "RGB")
+                   for [size, data] in zip(sizes, pixels)]
+    else:
+        [sizes, areas] = pack([[im.width, im.height] for im in sprites])
+        atlases = [pygame.Surface(size) for size in sizes]
+        for [sprite, [atlas_i, area]] in zip(sprites, areas):
+            atlases[atlas_i].blit(make_image(sprite), area[:2])
+        if cache != None:
+            pixels = [pygame.image.tostring(atlas, "RGB") for atlas in atlases]
+            file = open(cache, "wb")
+            marshal.dump([digest, [sizes, areas, pixels]], file)
+            file.close()
+    atlases = [atlas.convert() for atlas in atlases]
+    return [[atlases[atlas_i], area] for [atlas_i, area] in areas]
+
+def pack(sizes):
+    limit = [ATLAS_SIZE, ATLAS_SIZE]
+    for size in sizes:
+        limit = [max(limit[0], size[0]), max(limit[1], size[1])]
+    [atlases, areas] = [[], [None]*len(sizes)]
+    [left, top, shelf] = [0, 0, 0]
+    order = range(len(sizes))
+    order.sort(key=lambda i: -sizes[i][1])
+    for i in order:
+        [width, height] = sizes[i]
+        if left + width > limit[0]:
+            [left, top, shelf] = [0, top + shelf, 0]
+        if not atlases or top + height > limit[1]:
+            atlases.append([0, 0])
+            [left, top, shelf] = [0, 0, 0]
+        areas[i] = [len(atlases) - 1, [left, top, width, height]]
+        atlases[-1][0] = max(atlases[-1][0], left + width)
+        atlases[-1][1] = max(atlases[-1][1], top + height)
+        [left, shelf] = [left + width, max(shelf, height)]
+    return [atlases, areas]
 
 class Video:
-    def __init__(self, video):
+    def __init__(self, video, atlas=0, cache=None, digest=None, budget=0):
         size = [video.width, video.height]
         self.surface = pygame.display.set_mode(size, pygame.FULLSCREEN)
         self.layouts = video.layouts
         self.screens = [make_image(layout.screen) for layout in video.layouts]
-        self.sprites = [make_image(sprite) for sprite in video.sprites]
+        if atlas:
+            self.sprites = make_atlas(video.sprites, cache, digest)
+        else:
+            self.sprites = [[make_image(im), None] for im in video.sprites]
+        self.grids = [Grid(layout.targets, size) for layout in video.layouts]
+        [self.size, self.layout_i, self.drawn] = [size, None, None]
+        [self.frames, self.cache, self.budget] = [{}, [], budget]
+        self.used = 0
         self.goto(0)
 
-    def goto(self, layout_i):
+    def goto(self, layout_i, sprite_i=None, slot_i=None):
+        if layout_i != self.layout_i:
+            [self.layout_i, self.drawn] = [layout_i, None]
         self.layout = self.layouts[layout_i]
-        self.surface.blit(self.screens[layout_i], [0, 0])
+        self.base = []
+        if sprite_i != None:
+            self.base = [[sprite_i, slot_i]]
+        self.pastes = self.base[:]
 
     def paste(self, sprite_i, slot_i):
+        self.pastes.append([sprite_i, slot_i])
+
+    def update(self):
+        pygame.display.update(self.draw())
+
+    def draw(self):
+        if self.drawn == None:
+            rects = [[0, 0] + self.size]
+        else:
+            rects = []
+            [old, new] = [by_slot(self.drawn), by_slot(self.pastes)]
+            for slot_i in old.keys() + new.keys():
+                if old.get(slot_i) != new.get(slot_i):
+                    slot = self.layout.slots[slot_i]
+                    rect = [slot.left, slot.top, slot.width, slot.height]
+                    if rect not in rects:
+                        rects.append(rect)
+        [frame, pastes] = [self.frame(), self.pastes[len(self.base):]]
+        if frame == None:
+            [frame, pastes] = [self.screens[self.layout_i], self.pastes]
+        for rect in rects:
+            self.surface.set_clip(rect)
+            self.surface.blit(frame, [0, 0])
+            for [sprite_i, slot_i] in pastes:
+                self.blit(sprite_i, slot_i)
+        self.surface.set_clip(None)
+        self.drawn = self.pastes
+        return rects
+
+    def frame(self):
+        if not self.base:
+            return None
+        key = (self.layout_i, self.base[0][0], self.base[0][1])
+        if key in self.frames:
+            self.cache.remove(key)
+            self.cache.append(key)
+            return self.frames[key]
+        screen = self.screens[self.layout_i]
+        [width, height] = screen.get_size()
+        size = width*height*screen.get_bytesize()
+        if size > self.budget:
+            return None
+        frame = screen.copy()
+        self.blit(self.base[0][0], self.base[0][1], frame)
+        [self.frames[key], self.used] = [frame, self.used + size]
+        self.cache.append(key)
+        while self.used > self.budget:
+            frame = self.frames.pop(self.cache.pop(0))
+            [width, height] = frame.get_size()
+            self.used = self.used - width*height*frame.get_bytesize()
+        return self.frames[key]
+
+    def blit(self, sprite_i, slot_i, surface=None):
         slot = self.layout.slots[slot_i]
-        self.surface.blit(self.sprites[sprite_i], [slot.left, slot.top])
+        [sprite, area] = self.sprites[sprite_i]
+        (surface or self.surface).blit(sprite, [slot.left, slot.top], area)
 
     def locate(self, x, y):
-        for [i, target] in enumerate(self.layout.targets):
-            if target.left <= x and x < target.left + target.width:
-                if target.top <= y and y < target.top + target.height:
-                    return i
+        return self.grids[self.layout_i].locate(x, y)
+
+class Grid:
+    def __init__(self, targets, size):
+        [self.targets, self.size] = [targets, size]
+        self.columns = (size[0] + CELL - 1)/CELL
+        rows = (size[1] + CELL - 1)/CELL
+        self.cells = [[] for i in range(self.columns*rows)]
+        for [i, target] in enumerate(targets):
+            right = (target.left + target.width - 1)/CELL
+            bottom = (target.top + target.height - 1)/CELL
+            for row in range(target.top/CELL, bottom + 1):
+                for column in range(target.left/CELL, right + 1):
+                    self.cells[row*self.columns + column].append(i)
+
+    def locate(self, x, y):
+        if 0 <= x < self.size[0] and 0 <= y < self.size[1]:
+            for i in self.cells[y/CELL*self.columns + x/CELL]:
+                target = self.targets[i]
+                if target.left <= x and x < target.left + target.width:
+                    if target.top <= y and y < target.top + target.height:
+                        return i
+
+def by_slot(pastes):
+    slots = {}
+    for [sprite_i, slot_i] in pastes:
+        slots[slot_i] = slots.get(slot_i, []) + [sprite_i]
+    return slots
@@ -0,0 +1,193 @@
+"""Use this module to generate synthetic ballot definitions for testing
+and benchmarking.  Call generate() with the desired dimensions to get a
+ballot object built from the ballotio classes; it always passes
+verifier.verify().  Example:
+
+>>> b = generate(groups=20, options=8, pages=10)
+>>> ballotio.save('ballot', b)
+"""
+
+import sys, ballotio
+from ballotio import *
+
+[KEY_NEXT, KEY_BACK, KEY_DELETE, KEY_OPTION, KEY_LETTER] = [
+    275, 276, 8, 1000, 2000]
+
+def fill(seed, length):
+    pattern = ''.join([chr((seed*37 + i*11) % 256) for i in range(64)])
+    return (pattern*(length/64 + 1))[:length]
+
+class Sheet:
+    """Lays out rectangles left to right, top to bottom on a screen,
+    wrapping back to the top when the screen is full."""
+
+    def __init__(self, width, height):
+        [self.width, self.height] = [width, height]
+        [self.left, self.top, self.row] = [0, 0, 0]
+        self.rects = []
+
+    def place(self, width, height):
+        if self.left + width > self.width:
+            [self.left, self.top, self.row] = [0, self.top + self.row, 0]
+        if self.top + height > self.height:
+            [self.left, self.top, self.row] = [0, 0, 0]
+        rect = Rect(self.left, self.top, width, height)
+        self.left = self.left + width
+        self.row = max(self.row, height)
+        self.rects.append(rect)
+        return rect
+
+def generate(groups=4, options=5, max_sels=1, writeins=0, max_chars=8,
+             letters=26, pages=None, width=1024, height=768,
+             sprite_size=[240, 40], char_size=[20, 40], sample_rate=22050,
+             clip_ms=500, extra_clips=0, timeout_ms=15000):
+    """Generate a ballot with the given numbers of contests ('groups'),
+    options per contest, and contest pages (default one per contest).
+    Each contest allows up to 'max_sels' selections; if 'writeins' is
+    true, each contest also gets a write-in option with a write-in group
+    of 'letters' characters.  A review page and a final page are added
+    after the contest pages.  'clip_ms' sets the length of every clip and
+    'extra_clips' adds unused clips to pad the audio section."""
+    if pages is None:
+        pages = groups
+    [ballot, samples] = [Ballot(), sample_rate*clip_ms/1000]
+    ballot.model = Model(groups=[], pages=[], timeout_ms=timeout_ms)
+    ballot.text = Text(groups=[])
+    ballot.audio = Audio(sample_rate=sample_rate, clips=[])
+    ballot.video = Video(width=width, height=height, layouts=[], sprites=[])
+    [model, text, clips, sprites] = [
+        ballot.model, ballot.text, ballot.audio.clips, ballot.video.sprites]
+
+    def clip():
+        clips.append(Clip(samples=fill(len(clips), samples*2)))
+        return len(clips) - 1
+
+    def sprite(size):
+        [w, h] = size
+        sprites.append(Image(w, h, fill(len(sprites), w*h*3)))
+        return len(sprites) - 1
+
+    counter_size = [sprite_size[1], sprite_size[1]]
+    state_sprite = sprite(sprite_size)
+    cursor_sprite = sprite(sprite_size)
+    [prompt_clip, numbers_clip] = [clip(), clip()]
+    for i in range(max(max_sels, max_chars)):
+        clip()
+    counter_sprites = []
+
+    for group_i in range(groups):
+        group = Group(max_sels=max_sels, max_chars=0, option_clips=1,
+                      options=[])
+        names = []
+        for option_i in range(options):
+            option = Option(sprite(sprite_size), clip(), None)
+            sprite(sprite_size)
+            group.options.append(option)
+            names.append('Candidate %d.%d' % (group_i, option_i))
+        if writeins:
+            group.max_chars = max_chars
+            writein = Option(sprite(sprite_size), clip(), None)
+            sprite(sprite_size)
+            group.options.append(writein)
+            names.append('Write-in %d' % group_i)
+        model.groups.append(group)
+        text.groups.append(TextGroup(name='Contest %d' % group_i,
+                                     writein=0, options=names))
+        counter_sprites.append(sprite(counter_size))
+        for i in range(max_sels):
+            sprite(counter_size)
+
+    if writeins:
+        for group_i in range(groups):
+            group = Group(max_sels=max_chars, max_chars=0, option_clips=1,
+                          options=[])
+            names = []
+            for letter_i in range(letters):
+                group.options.append(Option(sprite(char_size), clip(), None))
+                sprite(char_size)
+                names.append(chr(65 + letter_i % 26))
+            model.groups[group_i].options[-1].writein_group_i = len(
+                model.groups)
+            model.groups.append(group)
+            text.groups.append(TextGroup(name='Write-in %d' % group_i,
+                                         writein=1, options=names))
+
+    for i in range(extra_clips):
+        clip()
+
+    def add_page(bindings, next_page_i):
+        state = State(sprite_i=state_sprite, bindings=[],
+            segments=[Segment([], SG_CLIP, prompt_clip, None, 0)],
+            timeout_segments=[Segment([], SG_CLIP, prompt_clip, None, 0)],
+            timeout_page_i=None, timeout_state_i=0)
+        if next_page_i is not None:
+            state.bindings.append(Binding(KEY_NEXT, None, [], [], [],
+                                          next_page_i, 0))
+        page = Page(bindings=bindings, states=[state], option_areas=[],
+                    counter_areas=[], review_areas=[])
+        sheet = Sheet(width, height)
+        sheet.place(*sprite_size)
+        layout = Layout(screen=Image(width, height, fill(len(
+            model.pages), width*height*3)), targets=[], slots=sheet.rects)
+        model.pages.append(page)
+        ballot.video.layouts.append(layout)
+        return [page, layout, sheet]
+
+    for page_i in range(pages):
+        bindings = [Binding(KEY_BACK, None, [], [], [],
+                            max(page_i - 1, 0), 0)]
+        [page, layout, sheet] = add_page(bindings, page_i + 1)
+        contests = range(page_i, groups, pages)
+        for group_i in contests:
+            group = model.groups[group_i]
+            for option_i in range(len(group.options)):
+                area_i = len(page.option_areas)
+                page.option_areas.append(OptionArea(group_i, option_i))
+                layout.targets.append(sheet.place(*sprite_size))
+                selected = Condition(PR_OPTION_SELECTED, None, area_i, 0)
+                unselected = Condition(PR_OPTION_SELECTED, None, area_i, 1)
+                for [key, target_i] in [[KEY_OPTION + area_i, None],
+                                        [None, area_i]]:
+                    bindings.append(Binding(key, target_i, [selected],
+                        [Step(OP_REMOVE, None, area_i)],
+                        [Segment([], SG_OPTION, 0, None, area_i)], None, 0))
+                    bindings.append(Binding(key, target_i, [unselected],
+                        [Step(OP_ADD, None, area_i)],
+                        [Segment([], SG_OPTION, 0, None, area_i)], None, 0))
+            page.states[0].segments.append(
+                Segment([], SG_LIST_SELS, 0, group_i, 0))
+        for group_i in contests:
+            page.counter_areas.append(
+                CounterArea(group_i, counter_sprites[group_i]))
+            sheet.place(*counter_size)
+            page.states[0].timeout_segments.append(
+                Segment([], SG_COUNT_SELS, numbers_clip, group_i, 0))
+        if writeins:
+            for group_i in contests:
+                writein_group_i = model.groups[group_i].options[-1].writein_group_i
+                for letter_i in range(letters):
+                    bindings.append(Binding(KEY_LETTER + letter_i, None, [],
+                        [Step(OP_APPEND, writein_group_i, letter_i)], [],
+                        None, 0))
+                bindings.append(Binding(KEY_DELETE, None, [],
+                    [Step(OP_POP, writein_group_i, 0)], [], None, 0))
+
+    [page, layout, sheet] = add_page([Binding(KEY_BACK, None, [], [], [],
+        max(pages - 1, 0), 0)], pages + 1)
+    for group_i in range(groups):
+        page.review_areas.append(ReviewArea(group_i, cursor_sprite))
+        for i in range(max_sels):
+            sheet.place(*sprite_size)
+            for j in range(model.groups[group_i].max_chars):
+                sheet.place(*char_size)
+    add_page([], None)
+    return ballot
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit('usage: %s <filename> [<name>=<value> ...]' % sys.argv[0])
+    options = {}
+    for arg in sys.argv[2:]:
+        [name, value] = arg.split('=')
+        options[name] = eval(value)
+    ballotio.save(sys.argv[1], generate(**options))
@@ -14,12 +14,36 @@ definition file, call save(filename, ballot).  Example:
 <Model: groups[10], pages[17], timeout_ms=20000>
 >>> save('ballot2', b)
 >>> 
+
+To read single items out of a large ballot definition without parsing
+the whole file, save it with an index and then call load_item():
+
+>>> save('ballot2', b, index=1)
+>>> load_item('ballot2', 'clips', 37)
+<Clip: samples[22050]>
+
+Ballot definition files come in two versions.  Version 1 stores clips
+and images as raw samples and pixels.  Version 2 can store each clip and
+image compressed with zlib.  load() reads either; save() writes version
+1 unless asked for version 2:
+
+>>> save('ballot3', b, version=2)
+
+To send a corrected ballot to machines that already have the old one,
+call diff() and send only the resulting delta; patch() rebuilds the new
+ballot from the old one and the delta:
+
+>>> save_delta('fix.delta', diff(load('ballot'), load('ballot2')))
+>>> save('ballot2', patch(load('ballot'), load_delta('fix.delta')))
 """
 
-import sha, struct
+import sha, struct, zlib
+from StringIO import StringIO
 
 sha_type = type(sha.sha())
 
+HEADERS = ['Pvote\x00\x01\x00', 'Pvote\x00\x02\x00']
+
 [OP_ADD, OP_REMOVE, OP_APPEND, OP_POP, OP_CLEAR] = range(5)
 [SG_CLIP, SG_OPTION, SG_LIST_SELS, SG_COUNT_SELS, SG_MAX_SELS] = range(5)
 [PR_GROUP_EMPTY, PR_GROUP_FULL, PR_OPTION_SELECTED] = range(3)
@@ -78,6 +102,69 @@ def serialize(*thing):
                         for name in thing.__members__])
     raise ValueError
 
+def write(out, *thing):
+    if len(thing) == 1:
+        thing = thing[0]
+    if thing is None or isinstance(thing, int):
+        out.write(serialize(thing))
+    elif isinstance(thing, list):
+        write(out, len(thing))
+        for item in thing:
+            write(out, item)
+    elif isinstance(thing, str):
+        write(out, len(thing))
+        out.write(thing)
+    elif hasattr(thing, 'write'):
+        thing.write(out)
+    elif hasattr(thing, '__members__'):
+        for name in thing.__members__:
+            write(out, getattr(thing, name))
+    else:
+        raise ValueError
+
+class Writer:
+    """A file-like object that computes the SHA-1 digest of everything
+    written to it, gathering small writes into blocks of at least
+    BLOCK_SIZE bytes and passing large ones straight through.  'file'
+    can be None to compute just the digest.  'version' is the version of
+    the ballot definition format being written.  The position of the
+    next byte can be recorded under a name with mark()."""
+
+    def __init__(self, file, version=1):
+        [self.file, self.sha, self.pending, self.length] = [
+            file, sha.sha(), [], 0]
+        [self.version, self.position, self.marks] = [version, 0, {}]
+
+    def mark(self, name):
+        self.marks.setdefault(name, []).append(self.position)
+
+    def write(self, data):
+        self.position = self.position + len(data)
+        if len(data) >= BLOCK_SIZE:
+            self.flush()
+            self.emit(data)
+        else:
+            self.pending.append(data)
+            self.length = self.length + len(data)
+            if self.length >= BLOCK_SIZE:
+                self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.emit(''.join(self.pending))
+            [self.pending, self.length] = [[], 0]
+
+    def emit(self, data):
+        self.sha.update(data)
+        if self.file is not None:
+            self.file.write(data)
+
+    def digest(self):
+        self.flush()
+        return self.sha.digest()
+
+BLOCK_SIZE = 65536
+
 def deserializer(Class):
     def deserialize(stream):
         thing = Class()
@@ -121,13 +208,17 @@ class Struct:
 
     def save(self, filename):
         file = open(filename, 'wb')
-        file.write(serialize(self))
+        out = Writer(file)
+        write(out, self)
+        out.flush()
         file.close()
 
 class Ballot(Struct):
     def load(self, stream):
-        assert stream.read(8) == "Pvote\x00\x01\x00"
+        header = stream.read(8)
+        assert header in HEADERS
         [self.stream, self.sha] = [stream, sha.sha()]
+        self.version = HEADERS.index(header) + 1
         self.model = deserializer(Model)(self)
         self.text = deserializer(Text)(self)
         self.audio = deserializer(Audio)(self)
@@ -139,13 +230,17 @@ class Ballot(Struct):
         self.sha.update(data)
         return data
 
-    def save(self, filename):
+    def save(self, filename, version=1):
         file = open(filename, 'wb')
-        file.write('Pvote\x00\x01\x00')
-        data = serialize(self)
-        file.write(data)
-        file.write(sha.sha(data).digest())
+        file.write(HEADERS[version - 1])
+        out = Writer(file, version)
+        for name in self.__members__:
+            out.mark('sections')
+            write(out, getattr(self, name))
+        out.mark('sections')
+        file.write(out.digest())
         file.close()
+        return out
 
 class Model(Struct):
     def load(self, stream):
@@ -244,13 +339,24 @@ class Audio(Struct):
         self.sample_rate = get_int(stream, 0)
         self.clips = get_list(stream, deserializer(Clip))
 
+    def write(self, out):
+        write(out, self.sample_rate)
+        write(out, len(self.clips))
+        for clip in self.clips:
+            out.mark('clips')
+            write(out, clip)
+
 class Clip(Struct):
     def load(self, stream):
-        self.samples = stream.read(get_int(stream, 0)*2)
+        self.samples = get_data(stream, get_int(stream, 0)*2)
 
     def serialize(self):
         return serialize(len(self.samples)/2) + self.samples
 
+    def write(self, out):
+        write(out, len(self.samples)/2)
+        write_data(out, self.samples)
+
 class Video(Struct):
     def load(self, stream):
         self.width = get_int(stream, 0)
@@ -258,6 +364,18 @@ class Video(Struct):
         self.layouts = get_list(stream, deserializer(Layout))
         self.sprites = get_list(stream, deserializer(Image))
 
+    def write(self, out):
+        write(out, self.width)
+        write(out, self.height)
+        write(out, len(self.layouts))
+        for layout in self.layouts:
+            out.mark('layouts')
+            write(out, layout)
+        write(out, len(self.sprites))
+        for sprite in self.sprites:
+            out.mark('sprites')
+            write(out, sprite)
+
 class Layout(Struct):
     def load(self, stream):
         self.screen = deserializer(Image)(stream)
@@ -268,11 +386,16 @@ class Image(Struct):
     def load(self, stream):
         self.width = get_int(stream, 0)
         self.height = get_int(stream, 0)
-        self.pixels = stream.read(self.width*self.height*3)
+        self.pixels = get_data(stream, self.width*self.height*3)
 
     def serialize(self):
         return serialize(self.width) + serialize(self.height) + self.pixels
 
+    def write(self, out):
+        write(out, self.width)
+        write(out, self.height)
+        write_data(out, self.pixels)
+
 class Rect(Struct):
     def load(self, stream):
         self.left = get_int(stream, 0)
@@ -280,6 +403,14 @@ class Rect(Struct):
         self.width = get_int(stream, 0)
         self.height = get_int(stream, 0)
 
+class Index(Struct):
+    def load(self, stream):
+        self.digest = stream.read(get_int(stream, 0))
+        self.sections = get_list(stream, get_offset)
+        self.clips = get_list(stream, get_offset)
+        self.layouts = get_list(stream, get_offset)
+        self.sprites = get_list(stream, get_offset)
+
 def get_int(stream, allow_none):
     [a, b, c, d] = list(stream.read(4))
     if ord(a) < 128:
@@ -300,6 +431,51 @@ def get_str(stream):
 def get_list(stream, Class):
     return [Class(stream) for i in range(get_int(stream, 0))]
 
+def get_offset(stream):
+    return get_int(stream, 0)
+
+def get_data(stream, length):
+    if stream.version > 1 and get_enum(stream, 2):
+        assert length > 0
+        inflater = zlib.decompressobj()
+        data = inflater.decompress(stream.read(get_int(stream, 0)), length)
+        assert len(data) == length and inflater.unconsumed_tail == ""
+        assert inflater.flush() == "" and inflater.unused_data == ""
+        return data
+    return stream.read(length)
+
+def write_data(out, data):
+    if out.version > 1:
+        packed = zlib.compress(data, 9)
+        if len(packed) < len(data):
+            write(out, 1)
+            write(out, packed)
+            return
+        write(out, 0)
+    out.write(data)
+
+class Delta(Struct):
+    def load(self, stream):
+        self.source = stream.read(get_int(stream, 0))
+        self.target = stream.read(get_int(stream, 0))
+        self.version = get_int(stream, 0)
+        self.values = get_list(stream, get_offset)
+        self.lengths = get_list(stream, get_offset)
+        self.items = get_list(stream, deserializer(Item))
+
+class Item(Struct):
+    def load(self, stream):
+        self.list_i = get_int(stream, 0)
+        self.item_i = get_int(stream, 0)
+        self.data = stream.read(get_int(stream, 0))
+
+class Reader:
+    def __init__(self, file, version):
+        [self.file, self.version] = [file, version]
+
+    def read(self, length):
+        return self.file.read(length)
+
 Ballot.__members__ = 'model text audio video'.split()
 Model.__members__ = 'groups pages timeout_ms'.split()
 Group.__members__ = 'max_sels max_chars option_clips options'.split()
@@ -321,6 +497,18 @@ Video.__members__ = 'width height layouts sprites'.split()
 Layout.__members__ = 'screen targets slots'.split()
 Image.__members__ = 'width height pixels'.split()
 Rect.__members__ = 'left top width height'.split()
+Index.__members__ = 'digest sections clips layouts sprites'.split()
+
+Delta.__members__ = 'source target version values lengths items'.split()
+Item.__members__ = 'list_i item_i data'.split()
+
+INDEX_CLASSES = {'clips': Clip, 'layouts': Layout, 'sprites': Image}
+
+DELTA_VALUES = [['model', 'timeout_ms'], ['audio', 'sample_rate'],
+                ['video', 'width'], ['video', 'height']]
+DELTA_LISTS = [['model', 'groups', Group], ['model', 'pages', Page],
+               ['text', 'groups', TextGroup], ['audio', 'clips', Clip],
+               ['video', 'layouts', Layout], ['video', 'sprites', Image]]
 
 def load(filename):
     """Read in a ballot definition file to get a ballot object."""
@@ -328,6 +516,219 @@ def load(filename):
     ballot.load(open(filename))
     return ballot
 
-def save(filename, ballot):
-    """Write out a ballot object to a ballot definition file."""
-    ballot.save(filename)
+def save(filename, ballot, index=0, version=1):
+    """Write out a ballot object to a ballot definition file in the given
+    version of the format.  If 'index' is true, also write a sidecar file
+    named filename + '.index' giving the byte offsets of the sections and
+    of every clip, layout and sprite (see make_index)."""
+    out = ballot.save(filename, version)
+    if index:
+        save_index(filename + '.index', make_index(out))
+
+def make_index(out):
+    """Make an index from the Writer that wrote a ballot definition file.
+    The 'sections' list holds the offsets of the model, text, audio and
+    video sections followed by the offset of the digest at the end of the
+    file; the 'clips', 'layouts' and 'sprites' lists hold the offset of
+    each item in those lists."""
+    index = Index(digest=out.digest())
+    for name in Index.__members__[1:]:
+        offsets = out.marks.get(name, [])
+        setattr(index, name, [8 + offset for offset in offsets])
+    return index
+
+def dedupe(ballot):
+    """Collapse identical sprites and clips in a ballot object, rewriting
+    every sprite_i and clip_i that refers to them, and return the number
+    of bytes this saves in the ballot definition file.  References that
+    cover a consecutive run of items (an option's two sprites, a counter's
+    sprites, an option's clips, the clips for a count) are kept pointing
+    at a run with the same contents, so the result still verifies."""
+    [sprite_refs, clip_refs] = find_references(ballot)
+    [video, audio] = [ballot.video, ballot.audio]
+    before = sum([8 + len(sprite.pixels) for sprite in video.sprites] +
+                 [4 + len(clip.samples) for clip in audio.clips])
+    video.sprites = collapse(video.sprites, sprite_refs,
+        lambda image: (image.width, image.height,
+                       sha.sha(image.pixels).digest()))
+    audio.clips = collapse(audio.clips, clip_refs,
+        lambda clip: sha.sha(clip.samples).digest())
+    after = sum([8 + len(sprite.pixels) for sprite in video.sprites] +
+                [4 + len(clip.samples) for clip in audio.clips])
+    return before - after
+
+def find_references(ballot):
+    """List the references to sprites and to clips in a ballot object, as
+    [object, attribute name, length of the run referred to] triples."""
+    [groups, sprite_refs, clip_refs] = [ballot.model.groups, {}, {}]
+    def add(refs, object, name, length):
+        refs[id(object), name] = [object, name, length]
+
+    for group in groups:
+        for option in group.options:
+            add(sprite_refs, option, 'sprite_i', 2)
+            add(clip_refs, option, 'clip_i', group.option_clips)
+    for page in ballot.model.pages:
+        segments = []
+        for binding in page.bindings:
+            segments.extend(binding.segments)
+        for state in page.states:
+            add(sprite_refs, state, 'sprite_i', 1)
+            segments.extend(state.segments + state.timeout_segments)
+            for binding in state.bindings:
+                segments.extend(binding.segments)
+        for area in page.counter_areas:
+            max_sels = groups[area.group_i].max_sels
+            add(sprite_refs, area, 'sprite_i', max_sels + 1)
+        for area in page.review_areas:
+            if area.cursor_sprite_i is not None:
+                add(sprite_refs, area, 'cursor_sprite_i', 1)
+        for segment in segments:
+            if segment.type == SG_CLIP:
+                add(clip_refs, segment, 'clip_i', 1)
+            if segment.type in [SG_COUNT_SELS, SG_MAX_SELS]:
+                group_i = segment.group_i
+                if group_i is None:
+                    group_i = page.option_areas[segment.option_i].group_i
+                add(clip_refs, segment, 'clip_i', groups[group_i].max_sels + 1)
+    return [sprite_refs.values(), clip_refs.values()]
+
+def collapse(items, refs, key):
+    """Remove duplicates from a list of items, given the references into
+    it and a function that returns a hashable key for an item's contents.
+    Items covered by overlapping references form blocks that are kept
+    together; a block is dropped if the same sequence of contents is
+    already present, and the references are rewritten to match."""
+    reach = range(1, len(items) + 1)
+    for [object, name, length] in refs:
+        start = getattr(object, name)
+        assert 0 <= start and start + length <= len(items)
+        reach[start] = max(reach[start], start + length)
+    [blocks, start, stop] = [[], 0, 0]
+    for i in range(len(items)):
+        stop = max(stop, reach[i])
+        if i + 1 == stop:
+            blocks.append([start, stop])
+            start = stop
+    blocks.sort(lambda a, b: cmp(b[1] - b[0], a[1] - a[0]) or cmp(a, b))
+
+    [keys, new_items, new_keys] = [map(key, items), [], []]
+    [positions, mapping] = [{}, [None]*len(items)]
+    for [start, stop] in blocks:
+        sequence = keys[start:stop]
+        for position in positions.get(sequence[0], []):
+            if new_keys[position:position + len(sequence)] == sequence:
+                break
+        else:
+            position = len(new_items)
+            for i in range(start, stop):
+                positions.setdefault(keys[i], []).append(len(new_items))
+                new_items.append(items[i])
+                new_keys.append(keys[i])
+        for i in range(start, stop):
+            mapping[i] = position + i - start
+
+    for [object, name, length] in refs:
+        setattr(object, name, mapping[getattr(object, name)])
+    return new_items
+
+def digest(ballot, version=1):
+    """Compute the SHA-1 digest that save() would write at the end of a
+    ballot definition file of the given version."""
+    out = Writer(None, version)
+    write(out, ballot)
+    return out.digest()
+
+def diff(old, new, version=1):
+    """Compute a delta that turns the ballot object 'old' into 'new'.
+    The delta holds the new values of the scalar fields and the lengths of
+    the group, page, text group, clip, layout and sprite lists, plus a
+    compressed copy of each list item that differs from the item at the
+    same position in 'old'.  It also holds the digest of 'old' and the
+    digest of 'new' as saved in the given version of the format."""
+    delta = Delta(source=digest(old, getattr(old, 'version', 1)),
+                  target=digest(new, version), version=version,
+                  values=[], lengths=[], items=[])
+    for [section, name] in DELTA_VALUES:
+        delta.values.append(getattr(getattr(new, section), name))
+    for [list_i, [section, name, Class]] in enumerate(DELTA_LISTS):
+        old_items = getattr(getattr(old, section), name)
+        new_items = getattr(getattr(new, section), name)
+        delta.lengths.append(len(new_items))
+        for [item_i, item] in enumerate(new_items):
+            data = serialize(item)
+            if item_i < len(old_items):
+                if serialize(old_items[item_i]) == data:
+                    continue
+            delta.items.append(Item(list_i, item_i, zlib.compress(data)))
+    return delta
+
+def patch(old, delta):
+    """Apply a delta made by diff() to the ballot object it was made from,
+    and return the new ballot object.  The result is checked against the
+    digest in the delta, so saving it in delta.version of the format gives
+    a file identical to the one the delta was made for.  (For version 2
+    this assumes the same zlib as on the machine that made the delta.)
+    'old' is left unchanged."""
+    assert digest(old, getattr(old, 'version', 1)) == delta.source
+    new = Ballot()
+    for name in Ballot.__members__:
+        section = getattr(old, name)
+        copy = section.__class__()
+        for member in section.__members__:
+            setattr(copy, member, getattr(section, member))
+        setattr(new, name, copy)
+    for [[section, name], value] in zip(DELTA_VALUES, delta.values):
+        setattr(getattr(new, section), name, value)
+    for [[section, name, Class], length] in zip(DELTA_LISTS, delta.lengths):
+        items = getattr(getattr(new, section), name)[:length]
+        setattr(getattr(new, section), name,
+                items + [None]*(length - len(items)))
+    for item in delta.items:
+        [section, name, Class] = DELTA_LISTS[item.list_i]
+        stream = Reader(StringIO(zlib.decompress(item.data)), 1)
+        getattr(getattr(new, section), name)[item.item_i] = (
+            deserializer(Class)(stream))
+    assert digest(new, delta.version) == delta.target
+    return new
+
+def save_delta(filename, delta):
+    """Write out a delta object to a delta file."""
+    file = open(filename, 'wb')
+    file.write('Pvdlt\x00\x01\x00')
+    file.write(serialize(delta))
+    file.close()
+
+def load_delta(filename):
+    """Read in a delta file to get a delta object."""
+    file = open(filename, 'rb')
+    assert file.read(8) == 'Pvdlt\x00\x01\x00'
+    return deserializer(Delta)(file)
+
+def save_index(filename, index):
+    """Write out an index object to an index file."""
+    file = open(filename, 'wb')
+    file.write('Pvidx\x00\x01\x00')
+    file.write(serialize(index))
+    file.close()
+
+def load_index(filename):
+    """Read in an index file to get an index object."""
+    file = open(filename, 'rb')
+    assert file.read(8) == 'Pvidx\x00\x01\x00'
+    return deserializer(Index)(file)
+
+def load_item(filename, kind, item_i, index=None):
+    """Read a single clip, layout or sprite (according to 'kind', which
+    is 'clips', 'layouts' or 'sprites') from a ballot definition file by
+    seeking straight to it.  The index is read from filename + '.index'
+    unless it is given; it must match the digest at the end of the file.
+    Note that the item itself is not covered by any hash check."""
+    if index is None:
+        index = load_index(filename + '.index')
+    file = open(filename, 'rb')
+    version = HEADERS.index(file.read(8)) + 1
+    file.seek(index.sections[-1])
+    assert file.read(20) == index.digest
+    file.seek(getattr(index, kind)[item_i])
+    return deserializer(INDEX_CLASSES[kind])(Reader(file, version))
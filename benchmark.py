@@ -0,0 +1,184 @@
+"""Use this module to time the parts of Pvote that dominate boot time and
+voter interaction, on synthetic ballots made by ballotgen.  From the
+command line:
+
+    python benchmark.py [options] [<name>=<value> ...]
+
+Each <name>=<value> pair is passed to ballotgen.generate() to set the
+scale of the ballot, e.g. "groups=40 options=12 clip_ms=2000".  Use
+--save to append the results to a JSON file under a label, and
+--compare to print them next to an earlier saved run.  Each benchmark
+returns a list of [name, seconds] pairs.  The Audio and Video benchmarks
+need pygame; they use SDL's dummy drivers so no screen is required."""
+
+import json, optparse, os, random, sys, tempfile
+from timeit import default_timer as clock
+from ballotio import Rect
+import ballotio, ballotgen, Ballot, verifier, simulator
+
+SCALES = {
+    'small': {'groups': 4, 'options': 5},
+    'medium': {'groups': 20, 'options': 10, 'writeins': 1, 'max_sels': 2},
+    'large': {'groups': 60, 'options': 20, 'writeins': 1, 'max_sels': 3,
+              'clip_ms': 2000, 'extra_clips': 500},
+}
+
+def timed(function, *args, **kw):
+    start = clock()
+    result = function(*args, **kw)
+    return [clock() - start, result]
+
+def bench_ballot(filename):
+    """Time parsing the ballot with and without Ballot.MappedFile, and
+    verifying it."""
+    [plain, ballot] = timed(Ballot.Ballot, open(filename, 'rb'))
+    [mapped, ballot] = timed(Ballot.Ballot,
+                             Ballot.MappedFile(open(filename, 'rb')))
+    [verify, result] = timed(verifier.verify, ballot)
+    return [['Ballot.Ballot', plain], ['Ballot.Ballot (mapped)', mapped],
+            ['verifier.verify', verify]]
+
+def bench_media(filename):
+    """Time constructing Audio and Video, and building every sound."""
+    try:
+        import pygame, Audio, Video
+    except ImportError:
+        print 'pygame is not installed; skipping Audio and Video'
+        return []
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    ballot = Ballot.Ballot(Ballot.MappedFile(open(filename, 'rb')))
+    [audio_time, audio] = timed(Audio.Audio, ballot.audio)
+    start = clock()
+    for clip_i in range(len(ballot.audio.clips)):
+        audio.prefetch(clip_i)
+    sounds_time = clock() - start
+    [video_time, video] = timed(Video.Video, ballot.video)
+    [atlas_time, video] = timed(Video.Video, ballot.video, atlas=1)
+    return [['Audio.Audio', audio_time], ['Audio.prefetch (all clips)',
+            sounds_time], ['Video.Video', video_time],
+            ['Video.Video (atlas)', atlas_time]]
+
+def bench_navigator(filename, sessions=200, seed=0):
+    """Time random voting sessions against Navigator, using the null
+    devices from simulator."""
+    ballot = Ballot.Ballot(open(filename, 'rb'))
+    [setup, sim] = timed(simulator.Simulator, ballot.model)
+    rng = random.Random(seed)
+    start = clock()
+    for i in range(sessions):
+        sim.random(rng, 1000, 0.05)
+    return [['Navigator setup', setup],
+            ['Navigator %d sessions' % sessions, clock() - start]]
+
+def scan(targets, x, y):
+    for [i, target] in enumerate(targets):
+        if target.left <= x and x < target.left + target.width:
+            if target.top <= y and y < target.top + target.height:
+                return i
+
+def make_targets(count, size, target_size):
+    """Scatter 'count' overlapping targets of 'target_size' over a screen
+    of the given size."""
+    rng = random.Random(count)
+    [width, height] = target_size
+    return [Rect(rng.randrange(size[0] - width + 1),
+                 rng.randrange(size[1] - height + 1), width, height)
+            for i in range(count)]
+
+def bench_locate(count=500, size=[1024, 768], target_size=[200, 50],
+                 touches=20000):
+    """Time Video.Grid.locate against a linear scan of the targets, as
+    Video.locate did before it had a grid.  Both must give the same
+    answer for every touch."""
+    try:
+        import Video
+    except ImportError:
+        print 'pygame is not installed; skipping Video.locate'
+        return []
+    targets = make_targets(count, size, target_size)
+    rng = random.Random(touches)
+    points = [[rng.randrange(size[0]), rng.randrange(size[1])]
+              for i in range(touches)]
+
+    start = clock()
+    expected = [scan(targets, x, y) for [x, y] in points]
+    scan_time = clock() - start
+
+    start = clock()
+    grid = Video.Grid(targets, size)
+    build_time = clock() - start
+
+    start = clock()
+    results = [grid.locate(x, y) for [x, y] in points]
+    grid_time = clock() - start
+
+    assert results == expected
+    return [['locate %d targets: scan' % count, scan_time],
+            ['locate %d targets: grid build' % count, build_time],
+            ['locate %d targets: grid' % count, grid_time]]
+
+def run(parameters, sessions=200):
+    """Generate a ballot with the given ballotgen parameters and run every
+    benchmark against it."""
+    [generate_time, ballot] = timed(ballotgen.generate, **parameters)
+    [fd, filename] = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        [save_time, result] = timed(ballotio.save, filename, ballot)
+        results = [['ballotgen.generate', generate_time],
+                   ['ballotio.save', save_time]]
+        results = results + bench_ballot(filename)
+        results = results + bench_media(filename)
+        results = results + bench_navigator(filename, sessions)
+        results = results + bench_locate()
+    finally:
+        os.remove(filename)
+    return results
+
+def load_results(filename):
+    if not os.path.exists(filename):
+        return {}
+    return json.load(open(filename))
+
+def save_results(filename, label, results):
+    """Store a run's results in a JSON file under the given label."""
+    saved = load_results(filename)
+    saved[label] = results
+    json.dump(saved, open(filename, 'w'), indent=1, sort_keys=True)
+
+def report(results, baseline=None):
+    old = dict(baseline or [])
+    for [name, seconds] in results:
+        if name in old:
+            print '%-40s %10.6f s %10.6f s %6.2fx' % (
+                name, seconds, old[name], seconds/max(old[name], 1e-9))
+        else:
+            print '%-40s %10.6f s' % (name, seconds)
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(
+        'usage: %prog [options] [<name>=<value> ...]')
+    parser.add_option('--scale', choices=SCALES.keys(), default='small')
+    parser.add_option('--sessions', type='int', default=200)
+    parser.add_option('--save', help='append the results to this JSON file')
+    parser.add_option('--label', default='latest')
+    parser.add_option('--compare', help='JSON file of earlier results')
+    parser.add_option('--baseline', default=None,
+                      help='label to compare against (default: the first)')
+    [options, args] = parser.parse_args()
+    parameters = SCALES[options.scale].copy()
+    for arg in args:
+        [name, value] = arg.split('=')
+        parameters[name] = eval(value)
+    results = run(parameters, options.sessions)
+    baseline = None
+    if options.compare:
+        saved = load_results(options.compare)
+        labels = sorted(saved.keys())
+        label = options.baseline or (labels and labels[0])
+        baseline = saved.get(label)
+        print 'comparing against %s' % label
+    report(results, baseline)
+    if options.save:
+        save_results(options.save, options.label, results)
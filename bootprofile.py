@@ -0,0 +1,203 @@
+"""Use this module to find out where boot time and memory go.  A Profile
+times each boot phase (loading the ballot, verifying it, and setting up
+audio and video) and notes the peak memory use after each one.  While it
+is enabled it also splits the ballot load into its four sections, each
+divided into reading, SHA-1 hashing and building objects, and times
+every sound and image that gets made.  Enabling it patches timing
+wrappers into Ballot, Audio and Video; disabling it puts the originals
+back, so a machine that does not profile pays nothing.  From the command
+line, boot a ballot as main.py does and write the profile as JSON:
+
+    python bootprofile.py ballot boot.json [prefetch] [mapped]
+
+With "mapped", the ballot is loaded through Ballot.MappedFile instead of
+the plain file that main.py reads; the report records which was used.
+
+or from a program:
+
+>>> profile = Profile()
+>>> profile.enable()
+>>> ballot = profile.phase('Ballot.Ballot', Ballot.Ballot, open('ballot'))
+>>> profile.disable()
+>>> profile.save('boot.json')
+"""
+
+import json, os, resource, sys
+from timeit import default_timer as clock
+import Ballot, verifier, Audio, Video
+
+TOP = 10
+
+class Hash:
+    def __init__(self, profile, hash):
+        [self.profile, self.hash] = [profile, hash]
+
+    def update(self, data):
+        start = clock()
+        self.hash.update(data)
+        self.profile.hashing = self.profile.hashing + clock() - start
+
+    def digest(self):
+        return self.hash.digest()
+
+class Profile:
+    def __init__(self, top=TOP):
+        [self.phases, self.sections, self.top] = [[], [], top]
+        [self.sounds, self.images, self.originals] = [[], [], []]
+        [self.reading, self.hashing, self.read_bytes] = [0.0, 0.0, 0]
+        self.loader = None
+
+    def enable(self):
+        """Install the timing wrappers.  Phases are timed either way."""
+        if self.originals:
+            return
+        [profile, module] = [self, Ballot.sha]
+
+        class sha:
+            def sha(self):
+                return Hash(profile, module.sha())
+
+        def wrap_read(read):
+            def wrapper(ballot, length):
+                start = clock()
+                data = read(ballot, length)
+                profile.reading = profile.reading + clock() - start
+                profile.read_bytes = profile.read_bytes + len(data)
+                return data
+            return wrapper
+
+        def wrap_section(name, Class):
+            def wrapper(stream):
+                return profile.section(name, Class, stream)
+            return wrapper
+
+        def wrap_get(get):
+            def wrapper(audio, key):
+                if key in audio.clips:
+                    return get(audio, key)
+                start = clock()
+                sound = get(audio, key)
+                profile.sounds.append(
+                    [clock() - start, list(key), audio.length(key)])
+                return sound
+            return wrapper
+
+        def wrap_make_image(make_image):
+            def wrapper(im):
+                start = clock()
+                surface = make_image(im)
+                profile.images.append([clock() - start, im])
+                return surface
+            return wrapper
+
+        self.patch(Ballot, 'sha', sha())
+        self.patch(Ballot.Ballot, 'read', wrap_read(Ballot.Ballot.read))
+        self.patch(Ballot.Ballot, 'view', wrap_read(Ballot.Ballot.view))
+        for name in ['Model', 'Text', 'Audio', 'Video']:
+            Class = getattr(Ballot, name)
+            self.patch(Ballot, name, wrap_section(name.lower(), Class))
+        self.patch(Audio.Audio, 'get', wrap_get(Audio.Audio.get))
+        self.patch(Video, 'make_image', wrap_make_image(Video.make_image))
+
+    def disable(self):
+        """Remove the timing wrappers and restore the originals."""
+        while self.originals:
+            [object, name, value] = self.originals.pop()
+            setattr(object, name, value)
+
+    def patch(self, object, name, value):
+        self.originals.append([object, name, object.__dict__[name]])
+        setattr(object, name, value)
+
+    def phase(self, name, function, *args, **kw):
+        """Call function(*args, **kw) as a boot phase and return its
+        result."""
+        [start, cpu] = [clock(), os.times()[0]]
+        result = function(*args, **kw)
+        self.phases.append({'name': name, 'seconds': clock() - start,
+                            'cpu_seconds': os.times()[0] - cpu,
+                            'maxrss_kb': maxrss()})
+        return result
+
+    def section(self, name, Class, stream):
+        [reading, hashing, size] = [self.reading, self.hashing,
+                                    self.read_bytes]
+        start = clock()
+        result = Class(stream)
+        seconds = clock() - start
+        reading = self.reading - reading
+        hashing = self.hashing - hashing
+        self.sections.append({
+            'name': name, 'seconds': seconds, 'bytes': self.read_bytes - size,
+            'read_seconds': reading - hashing, 'hash_seconds': hashing,
+            'build_seconds': seconds - reading})
+        return result
+
+    def report(self, ballot=None):
+        """Return the profile as a dictionary ready to save as JSON.  If
+        the ballot is given, images are named by where they appear in it
+        ('sprite 12', 'layout 3'); otherwise only by their size."""
+        names = {}
+        if ballot != None:
+            for [i, layout] in enumerate(ballot.video.layouts):
+                names[id(layout.screen)] = 'layout %d' % i
+            for [i, sprite] in enumerate(ballot.video.sprites):
+                names[id(sprite)] = 'sprite %d' % i
+        sounds = sorted(self.sounds, reverse=True)[:self.top]
+        images = sorted(self.images, key=lambda x: x[0], reverse=True)
+        return {
+            'loader': self.loader,
+            'phases': self.phases, 'sections': self.sections,
+            'sounds': {'count': len(self.sounds),
+                       'seconds': sum([s[0] for s in self.sounds])},
+            'images': {'count': len(self.images),
+                       'seconds': sum([i[0] for i in self.images])},
+            'top_sounds': [{'clips': key, 'seconds': seconds,
+                            'bytes': length}
+                           for [seconds, key, length] in sounds],
+            'top_images': [{'name': names.get(id(im), 'image'),
+                            'seconds': seconds, 'width': im.width,
+                            'height': im.height}
+                           for [seconds, im] in images[:self.top]]}
+
+    def save(self, filename, ballot=None):
+        """Write the report to a JSON file."""
+        json.dump(self.report(ballot), open(filename, 'w'),
+                  indent=1, sort_keys=True)
+
+def maxrss():
+    """Return the peak resident set size of this process in kilobytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def boot(filename, profile, prefetch=0, mapped=0):
+    """Boot from a ballot file the way main.py does, timing each phase.
+    With 'prefetch' set, also make every clip's sound, as a machine that
+    warms its audio cache at boot would.  With 'mapped' set, load the
+    ballot through Ballot.MappedFile instead of a plain file.  Return the
+    ballot and the devices."""
+    stream = open(filename)
+    if mapped:
+        stream = Ballot.MappedFile(stream)
+    profile.loader = ['open', 'Ballot.MappedFile'][mapped]
+    ballot = profile.phase('Ballot.Ballot', Ballot.Ballot, stream)
+    profile.phase('verifier.verify', verifier.verify, ballot)
+    audio = profile.phase('Audio.Audio', Audio.Audio, ballot.audio)
+    if prefetch:
+        def prefetch_all():
+            for clip_i in range(len(ballot.audio.clips)):
+                audio.prefetch(clip_i)
+        profile.phase('Audio.prefetch', prefetch_all)
+    video = profile.phase('Video.Video', Video.Video, ballot.video)
+    return [ballot, audio, video]
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print ('Usage: python bootprofile.py <ballot> <json file> '
+               '[prefetch] [mapped]')
+        sys.exit(1)
+    profile = Profile()
+    profile.enable()
+    [ballot, audio, video] = boot(sys.argv[1], profile,
+        'prefetch' in sys.argv[3:], 'mapped' in sys.argv[3:])
+    profile.disable()
+    profile.save(sys.argv[2], ballot)
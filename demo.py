@@ -13,7 +13,7 @@ printer = Printer.Printer(ballot.text)
 navigator = Navigator.Navigator(ballot.model, audio, video, printer)
 
 while 1:
-    pygame.display.update()
+    video.update()
     pygame.time.set_timer(TIMER_DONE, ballot.model.timeout_ms)
     event = pygame.event.wait()
     pygame.time.set_timer(TIMER_DONE, 0)
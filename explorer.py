@@ -0,0 +1,180 @@
+"""Use this module to explore every state a voter can reach on a ballot,
+instead of checking it by hand at a kiosk.  A state is the current page,
+the state within the page, and the selections in every group.  Starting
+from the state the Navigator starts in, the explorer tries every key and
+target that the state has bindings for, and a timeout.  It visits each
+new state once, in breadth-first order.  States are remembered by the
+SHA-1 digest of a canonical encoding, and the queue of states still to
+visit spills to a temporary file when it grows large.  When it is done
+it reports:
+
+  - pages and states that can never be reached
+  - dead ends: states off the final page that every event leaves as is
+  - groups in which the maximum number of selections is never reached
+
+From the command line:
+
+    python explorer.py ballot [max_states]
+"""
+
+import marshal, sha, sys, tempfile
+import Ballot, verifier, Navigator, simulator
+from Navigator import Selection
+
+SPILL = 100000
+
+class Frontier:
+    """A first-in, first-out queue of states that keeps at most 'limit'
+    states in memory and writes the rest to a temporary file."""
+
+    def __init__(self, limit=SPILL):
+        [self.limit, self.head, self.tail] = [limit, [], []]
+        [self.file, self.spilled, self.length] = [None, 0, 0]
+        [self.read_pos, self.write_pos] = [0, 0]
+
+    def __len__(self):
+        return self.length
+
+    def push(self, state):
+        self.tail.append(state)
+        self.length = self.length + 1
+        if len(self.tail) >= self.limit:
+            self.spill()
+
+    def pop(self):
+        if not self.head:
+            if self.spilled:
+                self.file.seek(self.read_pos)
+                self.head = marshal.load(self.file)
+                [self.read_pos, self.spilled] = [self.file.tell(),
+                                                 self.spilled - 1]
+            else:
+                [self.head, self.tail] = [self.tail, []]
+            self.head.reverse()
+        self.length = self.length - 1
+        return self.head.pop()
+
+    def spill(self):
+        if self.file == None:
+            self.file = tempfile.TemporaryFile()
+        self.file.seek(self.write_pos)
+        marshal.dump(self.tail, self.file)
+        [self.write_pos, self.spilled] = [self.file.tell(), self.spilled + 1]
+        self.tail = []
+
+class Explorer:
+    def __init__(self, model, limit=SPILL):
+        self.model = model
+        self.navigator = Navigator.Navigator(model, simulator.Audio(),
+            simulator.Video(), simulator.Printer())
+        [self.seen, self.frontier] = [set(), Frontier(limit)]
+        self.visited = [[0]*len(page.states) for page in model.pages]
+        self.most = [0]*len(model.groups)
+        [self.dead_ends, self.transitions] = [[], 0]
+        self.events = []
+        for [page_i, page] in enumerate(model.pages):
+            self.events.append([])
+            for state_i in range(len(page.states)):
+                events = [['timeout', ()]]
+                for key in self.navigator.keys[page_i][state_i]:
+                    if key != None:
+                        events.append(['press', (key,)])
+                for target_i in self.navigator.targets[page_i][state_i]:
+                    if target_i != None:
+                        events.append(['touch', (target_i,)])
+                self.events[page_i].append(events)
+
+    def run(self, max_states=None):
+        """Explore until there are no new states, or until 'max_states'
+        states have been visited.  Return 1 if the exploration finished."""
+        self.add(self.capture())
+        final_page_i = len(self.model.pages) - 1
+        while len(self.frontier):
+            if max_states != None and len(self.seen) >= max_states:
+                return 0
+            state = self.frontier.pop()
+            [page_i, state_i, selections] = state
+            if page_i == final_page_i:
+                continue
+            moved = 0
+            for [method, args] in self.events[page_i][state_i]:
+                self.restore(state)
+                getattr(self.navigator, method)(*args)
+                next = self.capture()
+                self.transitions = self.transitions + 1
+                if next != state:
+                    moved = 1
+                    self.add(next)
+            if not moved:
+                self.dead_ends.append([page_i, state_i, selections])
+        return 1
+
+    def add(self, state):
+        digest = sha.sha(marshal.dumps(state)).digest()
+        if digest not in self.seen:
+            self.seen.add(digest)
+            self.frontier.push(state)
+            [page_i, state_i, selections] = state
+            self.visited[page_i][state_i] = 1
+            for [group_i, selection] in enumerate(selections):
+                self.most[group_i] = max(self.most[group_i], len(selection))
+
+    def capture(self):
+        navigator = self.navigator
+        selections = [tuple(selection) for selection in navigator.selections]
+        return (navigator.page_i, navigator.state_i, tuple(selections))
+
+    def restore(self, state):
+        [page_i, state_i, selections] = state
+        navigator = self.navigator
+        [navigator.page_i, navigator.page] = [page_i, self.model.pages[page_i]]
+        [navigator.state_i, navigator.state] = [
+            state_i, navigator.page.states[state_i]]
+        navigator.selections = []
+        for options in selections:
+            selection = Selection()
+            for option_i in options:
+                selection.append(option_i)
+            navigator.selections.append(selection)
+
+    def report(self):
+        """Return [unreachable, dead_ends, unfilled], where 'unreachable'
+        lists the [page_i, state_i] pairs never visited, 'dead_ends'
+        lists the states that no event leaves, and 'unfilled' lists
+        [group_i, most, max_sels] for each group whose selections never
+        reached max_sels."""
+        unreachable = []
+        for [page_i, states] in enumerate(self.visited):
+            for [state_i, visited] in enumerate(states):
+                if not visited:
+                    unreachable.append([page_i, state_i])
+        unfilled = []
+        for [group_i, group] in enumerate(self.model.groups):
+            if self.most[group_i] < group.max_sels:
+                unfilled.append([group_i, self.most[group_i], group.max_sels])
+        return [unreachable, self.dead_ends, unfilled]
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print 'Usage: python explorer.py <ballot> [<max_states>]'
+        sys.exit(1)
+    max_states = None
+    if len(sys.argv) > 2:
+        max_states = int(sys.argv[2])
+    ballot = Ballot.Ballot(open(sys.argv[1], 'rb'))
+    verifier.verify(ballot)
+    explorer = Explorer(ballot.model)
+    finished = explorer.run(max_states)
+    [unreachable, dead_ends, unfilled] = explorer.report()
+    print '%d states, %d transitions%s' % (len(explorer.seen),
+        explorer.transitions, [' (stopped early)', ''][finished])
+    print '%d unreachable page/states:' % len(unreachable),
+    print ' '.join(['%d/%d' % (page_i, state_i)
+                    for [page_i, state_i] in unreachable])
+    print '%d dead ends:' % len(dead_ends)
+    for [page_i, state_i, selections] in dead_ends[:20]:
+        print '  page %d state %d selections %r' % (
+            page_i, state_i, [list(s) for s in selections])
+    print '%d groups never filled:' % len(unfilled)
+    for [group_i, most, max_sels] in unfilled:
+        print '  group %d: at most %d of %d' % (group_i, most, max_sels)
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+"""Use this module in place of main.py to run the voting machine with an
+event loop that keeps its own deadline for the ballot's timeout, rather
+than setting a pygame timer around every wait.  Navigation is the same
+as in main.py: any event pushes the deadline back by timeout_ms, and
+when the deadline passes the Navigator times out unless audio is still
+playing.  The screen is redrawn at most once per frame, however many
+events arrive in between.  On exit (window close or Ctrl-C) it reports
+how long each key press or touch took to reach the screen:
+
+    python loop.py [ballot]
+"""
+
+import sys, pygame
+import Ballot, verifier, Audio, Video, Printer, Navigator
+
+FRAME_MS = 1000/60
+POLL_MS = 5
+
+class Loop:
+    def __init__(self, navigator, audio, video, timeout_ms):
+        [self.navigator, self.audio, self.video] = [navigator, audio, video]
+        self.timeout_ms = timeout_ms
+        [self.dirty, self.drawn, self.deadline] = [1, None, None]
+        [self.inputs, self.latencies] = [[], []]
+
+    def run(self):
+        """Handle events until the window is closed."""
+        self.deadline = pygame.time.get_ticks() + self.timeout_ms
+        while 1:
+            now = pygame.time.get_ticks()
+            if self.dirty and (self.drawn == None or
+                               now >= self.drawn + FRAME_MS):
+                self.draw()
+                now = pygame.time.get_ticks()
+            if now >= self.deadline:
+                self.expire(now)
+                continue
+            wake = self.deadline
+            if self.dirty:
+                wake = min(wake, self.drawn + FRAME_MS)
+            event = wait(max(wake - now, 1))
+            while event.type != pygame.NOEVENT:
+                if event.type == pygame.QUIT:
+                    return
+                self.handle(event, pygame.time.get_ticks())
+                event = pygame.event.poll()
+
+    def handle(self, event, now):
+        """Dispatch one event, as the body of the loop in main.py does."""
+        [self.deadline, self.dirty] = [now + self.timeout_ms, 1]
+        if event.type == pygame.KEYDOWN:
+            self.inputs.append(now)
+            self.navigator.press(event.key)
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            self.inputs.append(now)
+            [x, y] = event.pos
+            target_i = self.video.locate(x, y)
+            if target_i != None:
+                self.navigator.touch(target_i)
+        if event.type == Audio.AUDIO_DONE:
+            self.audio.next()
+
+    def expire(self, now):
+        """Time out if no audio is playing, and start a new deadline."""
+        [self.deadline, self.dirty] = [now + self.timeout_ms, 1]
+        if not self.audio.playing:
+            self.navigator.timeout()
+
+    def draw(self):
+        """Bring the screen up to date and note how long the inputs
+        handled since the last frame have waited to appear."""
+        self.video.update()
+        [self.drawn, self.dirty] = [pygame.time.get_ticks(), 0]
+        for start in self.inputs:
+            self.latencies.append(self.drawn - start)
+        self.inputs = []
+
+    def report(self, out=sys.stderr):
+        """Print a summary of input-to-screen latencies in milliseconds."""
+        if not self.latencies:
+            print >>out, 'no inputs'
+            return
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        print >>out, '%d inputs: mean %.1f ms' % (
+            count, float(sum(latencies))/count),
+        for percent in [50, 95, 99]:
+            print >>out, 'p%d %d ms' % (
+                percent, latencies[min(count*percent/100, count - 1)]),
+        print >>out, 'max %d ms' % latencies[-1]
+
+def wait(timeout):
+    """Wait up to 'timeout' milliseconds for an event; return NOEVENT if
+    none arrives.  pygame before 2.0 cannot wait with a timeout, so there
+    we poll every POLL_MS milliseconds instead."""
+    if pygame.version.vernum[0] >= 2:
+        return pygame.event.wait(timeout)
+    event = pygame.event.poll()
+    if event.type == pygame.NOEVENT:
+        pygame.time.wait(min(timeout, POLL_MS))
+    return event
+
+if __name__ == '__main__':
+    filename = 'ballot'
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    ballot = Ballot.Ballot(open(filename, 'rb'))
+    verifier.verify(ballot)
+    audio = Audio.Audio(ballot.audio)
+    video = Video.Video(ballot.video)
+    printer = Printer.Printer(ballot.text)
+    navigator = Navigator.Navigator(ballot.model, audio, video, printer)
+    loop = Loop(navigator, audio, video, ballot.model.timeout_ms)
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        pass
+    loop.report()
@@ -0,0 +1,227 @@
+"""Use this module to run a verified ballot with its conditions, steps and
+segments compiled into Python closures, instead of having the Navigator
+interpret them on every key press.  Each closure has its group and
+option already resolved against the page it belongs to, and is chosen
+for its predicate, operation or segment type in advance.  A compiled
+Navigator is a drop-in replacement for Navigator.Navigator:
+
+>>> navigator = CompiledNavigator(ballot.model, audio, video, printer)
+
+It still goes through its own test(), execute() and play() methods and
+through the devices, so tracing.Tracer sees the same calls.  Only use it
+on a ballot that has passed verifier.verify().  To check that it behaves
+exactly like Navigator.Navigator on a ballot, from the command line:
+
+    python precompile.py ballot [sessions]
+"""
+
+import random, sys
+import Ballot, verifier, Navigator
+from Navigator import Selection
+
+class CompiledNavigator(Navigator.Navigator):
+    def __init__(self, model, audio, video, printer):
+        self.compiled = build(model)
+        Navigator.Navigator.__init__(self, model, audio, video, printer)
+
+    def test(self, conditions):
+        return self.compiled[id(conditions)](self)
+
+    def execute(self, step):
+        self.compiled[id(step)](self)
+
+    def play(self, segments):
+        self.compiled[id(segments)](self)
+
+def build(model):
+    """Compile every condition list, step and segment list in the model.
+    Return a dictionary that maps the id() of each of these objects to a
+    function that takes the Navigator and does the same job as
+    Navigator.test(), execute() or play() would do for it."""
+    compiled = {}
+    def add_segments(page, segments):
+        compiled[id(segments)] = compile_segments(model, page, segments)
+        for segment in segments:
+            add_conditions(page, segment.conditions)
+    def add_conditions(page, conditions):
+        compiled[id(conditions)] = compile_conditions(model, page, conditions)
+    for page in model.pages:
+        bindings = page.bindings[:]
+        for state in page.states:
+            bindings.extend(state.bindings)
+            add_segments(page, state.segments)
+            add_segments(page, state.timeout_segments)
+        for binding in bindings:
+            add_conditions(page, binding.conditions)
+            for step in binding.steps:
+                compiled[id(step)] = compile_step(model, page, step)
+            add_segments(page, binding.segments)
+    return compiled
+
+def resolve(page, object):
+    """Do what Navigator.get_option() does, ahead of time."""
+    if object.group_i == None:
+        area = page.option_areas[object.option_i]
+        return [area.group_i, area.option_i]
+    return [object.group_i, object.option_i]
+
+def compile_conditions(model, page, conditions):
+    tests = [compile_condition(model, page, cond) for cond in conditions]
+    if len(tests) == 0:
+        return lambda nav: 1
+    if len(tests) == 1:
+        return tests[0]
+    def test_all(nav):
+        for test in tests:
+            if not test(nav):
+                return 0
+        return 1
+    return test_all
+
+def compile_condition(model, page, cond):
+    [group_i, option_i] = resolve(page, cond)
+    if cond.predicate == Navigator.PR_GROUP_EMPTY:
+        if cond.invert:
+            return lambda nav: len(nav.selections[group_i]) != 0
+        return lambda nav: len(nav.selections[group_i]) == 0
+    if cond.predicate == Navigator.PR_GROUP_FULL:
+        max = model.groups[group_i].max_sels
+        if cond.invert:
+            return lambda nav: len(nav.selections[group_i]) != max
+        return lambda nav: len(nav.selections[group_i]) == max
+    if cond.predicate == Navigator.PR_OPTION_SELECTED:
+        if cond.invert:
+            return lambda nav: option_i not in nav.selections[group_i]
+        return lambda nav: option_i in nav.selections[group_i]
+
+def compile_step(model, page, step):
+    [group_i, option_i] = resolve(page, step)
+    max = model.groups[group_i].max_sels
+    if step.op == Navigator.OP_ADD:
+        def add(nav):
+            selections = nav.selections[group_i]
+            if option_i not in selections and len(selections) < max:
+                selections.append(option_i)
+        return add
+    if step.op == Navigator.OP_APPEND:
+        def append(nav):
+            selections = nav.selections[group_i]
+            if len(selections) < max:
+                selections.append(option_i)
+        return append
+    if step.op == Navigator.OP_REMOVE:
+        def remove(nav):
+            selections = nav.selections[group_i]
+            if option_i in selections:
+                selections.remove(option_i)
+        return remove
+    if step.op == Navigator.OP_POP:
+        def pop(nav):
+            selections = nav.selections[group_i]
+            if len(selections) > 0:
+                selections.pop()
+        return pop
+    if step.op == Navigator.OP_CLEAR:
+        def clear(nav):
+            nav.selections[group_i] = Selection()
+        return clear
+
+def compile_segments(model, page, segments):
+    plays = [compile_segment(model, page, segment) for segment in segments]
+    def play_all(nav):
+        for play in plays:
+            play(nav)
+    return play_all
+
+def compile_segment(model, page, segment):
+    play = compile_play(model, page, segment)
+    conditions = segment.conditions
+    if len(conditions) == 0:
+        return play
+    def conditional(nav):
+        if nav.test(conditions):
+            play(nav)
+    return conditional
+
+def compile_play(model, page, segment):
+    clip_i = segment.clip_i
+    if segment.type == Navigator.SG_CLIP:
+        return lambda nav: nav.audio.play(clip_i)
+    [group_i, option_i] = resolve(page, segment)
+    group = model.groups[group_i]
+    if segment.type == Navigator.SG_OPTION:
+        option = group.options[option_i]
+        return lambda nav: nav.play_option(option, clip_i)
+    if segment.type == Navigator.SG_LIST_SELS:
+        def list_sels(nav):
+            for option_i in nav.selections[group_i]:
+                nav.play_option(group.options[option_i], clip_i)
+        return list_sels
+    if segment.type == Navigator.SG_COUNT_SELS:
+        def count_sels(nav):
+            nav.audio.play(clip_i + len(nav.selections[group_i]))
+        return count_sels
+    if segment.type == Navigator.SG_MAX_SELS:
+        clip_i = clip_i + group.max_sels
+        return lambda nav: nav.audio.play(clip_i)
+
+class Recorder:
+    def __init__(self, log, name):
+        [self.log, self.name] = [log, name]
+
+    def __getattr__(self, method):
+        def call(*args):
+            if method == 'write':
+                args = [list(selection) for selection in args[0]]
+            self.log.append([self.name, method, args])
+        return call
+
+def check(model, sessions=100, seed=0, max_events=200, timeout_rate=0.05):
+    """Run random sessions on a Navigator and a CompiledNavigator side by
+    side, and check that they make the same calls to their devices and
+    end up in the same page, state and selections after every event.
+    Return the number of events checked; raise AssertionError with the
+    session and event number on the first difference."""
+    [logs, navigators] = [[[], []], []]
+    for [log, Class] in zip(logs, [Navigator.Navigator, CompiledNavigator]):
+        [audio, video, printer] = [Recorder(log, 'audio'),
+            Recorder(log, 'video'), Recorder(log, 'printer')]
+        navigators.append(Class(model, audio, video, printer))
+    [interpreted, compiled] = navigators
+    [rng, count] = [random.Random(seed), 0]
+    for session in range(sessions):
+        for navigator in navigators:
+            navigator.reset()
+        for event_i in range(max_events):
+            [page_i, state_i] = [interpreted.page_i, interpreted.state_i]
+            keys = interpreted.keys[page_i][state_i].keys()
+            targets = interpreted.targets[page_i][state_i].keys()
+            events = [['press', key] for key in keys if key != None]
+            events = events + [['touch', t] for t in targets if t != None]
+            if len(events) == 0 or rng.random() < timeout_rate:
+                [method, args] = ['timeout', ()]
+            else:
+                [method, arg] = rng.choice(events)
+                args = (arg,)
+            for navigator in navigators:
+                getattr(navigator, method)(*args)
+            count = count + 1
+            [a, b] = [summarize(interpreted), summarize(compiled)]
+            assert logs[0] == logs[1] and a == b, (session, event_i)
+            [logs[0][:], logs[1][:]] = [[], []]
+    return count
+
+def summarize(navigator):
+    return [navigator.page_i, navigator.state_i,
+            [list(selection) for selection in navigator.selections]]
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print 'Usage: python precompile.py <ballot> [<sessions>]'
+        sys.exit(1)
+    sessions = 100
+    if len(sys.argv) > 2:
+        sessions = int(sys.argv[2])
+    ballot = Ballot.Ballot(open(sys.argv[1], 'rb'))
+    verifier.verify(ballot)
+    print '%d events matched' % check(ballot.model, sessions)
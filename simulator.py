@@ -0,0 +1,198 @@
+"""Use this module to run many voting sessions against a ballot without
+a screen, speakers or printer.  The Navigator is driven by null Audio,
+Video and Printer objects, and each session ends when a record is
+printed or when it runs out of events.  Sessions are either generated at
+random or replayed from a script, and are spread over a pool of worker
+processes.  From the command line:
+
+    python simulator.py ballot -n 1000000
+    python simulator.py ballot --script sessions.txt
+
+A script holds one event per line ("key <key>", "touch <target_i>" or
+"timeout"), with a blank line between sessions."""
+
+import multiprocessing, optparse, random, sys
+from timeit import default_timer as clock
+import Ballot, verifier, Navigator
+
+class Audio:
+    playing = 0
+
+    def play(self, clip_i):
+        pass
+
+    def stop(self):
+        pass
+
+    def prefetch(self, clip_i):
+        pass
+
+class Video:
+    def goto(self, layout_i, sprite_i=None, slot_i=None):
+        pass
+
+    def paste(self, sprite_i, slot_i):
+        pass
+
+class Printer:
+    def __init__(self):
+        self.record = None
+
+    def write(self, selections):
+        self.record = tuple([tuple(selection) for selection in selections])
+
+class Simulator:
+    def __init__(self, model):
+        self.printer = Printer()
+        self.navigator = Navigator.Navigator(
+            model, Audio(), Video(), self.printer)
+        self.timeout = [self.navigator.timeout, ()]
+        self.events = []
+        for [page_i, page] in enumerate(model.pages):
+            self.events.append([])
+            for state_i in range(len(page.states)):
+                events = []
+                for key in self.navigator.keys[page_i][state_i]:
+                    if key != None:
+                        events.append([self.navigator.press, (key,)])
+                for target_i in self.navigator.targets[page_i][state_i]:
+                    if target_i != None:
+                        events.append([self.navigator.touch, (target_i,)])
+                self.events[page_i].append(events)
+
+    def replay(self, script):
+        """Run one session from a list of [kind, value] events, where kind
+        is 'key', 'touch' or 'timeout'.  Return the printed record, or
+        None if the session never reached the final page."""
+        self.start()
+        for [kind, value] in script:
+            if self.printer.record != None:
+                break
+            if kind == 'key':
+                self.navigator.press(value)
+            if kind == 'touch':
+                self.navigator.touch(value)
+            if kind == 'timeout':
+                self.navigator.timeout()
+        return self.printer.record
+
+    def random(self, rng, max_events, timeout_rate):
+        """Run one session of at most 'max_events' random events that the
+        current state has bindings for, with a timeout instead of a key
+        or touch at the given rate.  Return the printed record or None."""
+        self.start()
+        for i in range(max_events):
+            if self.printer.record != None:
+                break
+            navigator = self.navigator
+            events = self.events[navigator.page_i][navigator.state_i]
+            if len(events) == 0 or rng.random() < timeout_rate:
+                [method, args] = self.timeout
+            else:
+                [method, args] = rng.choice(events)
+            method(*args)
+        return self.printer.record
+
+    def start(self):
+        self.printer.record = None
+        self.navigator.reset()
+
+def read_script(filename):
+    """Read a script file into a list of sessions, each a list of events."""
+    [sessions, script] = [[], []]
+    for line in open(filename).readlines() + ['']:
+        words = line.split()
+        if len(words) == 0:
+            if len(script):
+                sessions.append(script)
+            script = []
+        elif words[0] == 'timeout':
+            script.append(['timeout', None])
+        else:
+            script.append([words[0], int(words[1])])
+    return sessions
+
+simulator = None
+settings = None
+
+def start_worker(filename, max_events, timeout_rate):
+    global simulator, settings
+    ballot = Ballot.Ballot(Ballot.MappedFile(open(filename, 'rb')))
+    simulator = Simulator(ballot.model)
+    settings = [max_events, timeout_rate]
+
+def run_random(job):
+    [seed, count] = job
+    [rng, counts] = [random.Random(seed), {}]
+    for i in range(count):
+        record = simulator.random(rng, settings[0], settings[1])
+        counts[record] = counts.get(record, 0) + 1
+    return counts
+
+def run_scripts(scripts):
+    counts = {}
+    for script in scripts:
+        record = simulator.replay(script)
+        counts[record] = counts.get(record, 0) + 1
+    return counts
+
+def simulate(filename, sessions=1000, processes=None, batch=1000, seed=0,
+             max_events=1000, timeout_rate=0.05, scripts=None):
+    """Run 'sessions' random sessions (or the given scripted sessions)
+    against the ballot in 'filename' on a pool of worker processes.
+    Return the number of sessions run, the elapsed time in seconds, and a
+    dictionary mapping each printed record to the number of sessions that
+    printed it (None counts the sessions that never finished)."""
+    pool = multiprocessing.Pool(processes, start_worker,
+                                [filename, max_events, timeout_rate])
+    if scripts == None:
+        jobs = [[seed + i, min(batch, sessions - i*batch)]
+                for i in range((sessions + batch - 1)/batch)]
+        work = run_random
+    else:
+        sessions = len(scripts)
+        jobs = [scripts[i:i + batch] for i in range(0, sessions, batch)]
+        work = run_scripts
+    [start, counts] = [clock(), {}]
+    for result in pool.imap_unordered(work, jobs):
+        for [record, count] in result.items():
+            counts[record] = counts.get(record, 0) + count
+    elapsed = clock() - start
+    pool.close()
+    pool.join()
+    return [sessions, elapsed, counts]
+
+def report(sessions, elapsed, counts, top=10):
+    print '%d sessions in %.2f s: %.0f sessions/s' % (
+        sessions, elapsed, sessions/max(elapsed, 1e-9))
+    unfinished = counts.get(None, 0)
+    records = [[count, record] for [record, count] in counts.items()
+               if record != None]
+    records.sort()
+    records.reverse()
+    print '%d distinct records, %d sessions did not finish' % (
+        len(records), unfinished)
+    for [count, record] in records[:top]:
+        print '%10d  %s' % (count, [list(selection) for selection in record])
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser('usage: %prog [options] <ballot>')
+    parser.add_option('-n', '--sessions', type='int', default=1000)
+    parser.add_option('-p', '--processes', type='int')
+    parser.add_option('-b', '--batch', type='int', default=1000)
+    parser.add_option('-s', '--seed', type='int', default=0)
+    parser.add_option('-e', '--max-events', type='int', default=1000)
+    parser.add_option('-t', '--timeout-rate', type='float', default=0.05)
+    parser.add_option('--script', help='replay sessions from this file')
+    parser.add_option('--top', type='int', default=10)
+    [options, args] = parser.parse_args()
+    if len(args) != 1:
+        parser.error('expected one ballot file')
+    verifier.verify(Ballot.Ballot(Ballot.MappedFile(open(args[0], 'rb'))))
+    scripts = None
+    if options.script:
+        scripts = read_script(options.script)
+    [sessions, elapsed, counts] = simulate(
+        args[0], options.sessions, options.processes, options.batch,
+        options.seed, options.max_events, options.timeout_rate, scripts)
+    report(sessions, elapsed, counts, options.top)
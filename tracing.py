@@ -0,0 +1,146 @@
+"""Use this module to find out where the time goes when the voter presses
+a key, touches the screen or lets the ballot time out.  A Tracer wraps
+methods of a running Navigator and its Audio and Video objects.  It
+splits the time spent on each event among four kinds of work, so that
+nested calls are not counted twice:
+
+    conditions  Navigator.test
+    steps       Navigator.execute
+    audio       Navigator.play and Audio.play
+    render      Navigator.update and Video.paste
+
+and whatever is left over (Navigator.invoke and the rest) is "other".
+Each call to Video.update, which draws the screen, is traced as an event
+of its own.  The last few thousand events are kept in a ring buffer
+along with the page and state they arrived on.  A log2 histogram of
+each kind of time, in microseconds, covers every event since the tracer
+was attached.  After a session, save them as JSON:
+
+>>> tracer = Tracer(navigator, audio, video)
+>>> tracer.attach()
+... (voting session) ...
+>>> tracer.save('trace.json')
+"""
+
+import json
+from timeit import default_timer as clock
+
+CATEGORIES = ['conditions', 'steps', 'audio', 'render', 'other']
+[CONDITIONS, STEPS, AUDIO, RENDER, OTHER] = range(5)
+FIELDS = ['event', 'arg', 'page_i', 'state_i', 'total'] + CATEGORIES
+BUCKETS = 32
+
+class Tracer:
+    def __init__(self, navigator, audio, video, size=4096):
+        [self.navigator, self.audio, self.video] = [navigator, audio, video]
+        [self.size, self.events, self.next] = [size, [], 0]
+        self.histograms = {}
+        for name in ['total'] + CATEGORIES:
+            self.histograms[name] = [0]*BUCKETS
+        [self.current, self.mark, self.times] = [None, 0, [0.0]*5]
+        self.originals = []
+
+    def attach(self):
+        """Start tracing by wrapping the methods of the three objects."""
+        if self.originals:
+            return
+        [navigator, audio, video] = [self.navigator, self.audio, self.video]
+        self.wrap(navigator, 'press', self.event('key', OTHER))
+        self.wrap(navigator, 'touch', self.event('touch', OTHER))
+        self.wrap(navigator, 'timeout', self.event('timeout', OTHER))
+        if hasattr(video, 'update'):
+            self.wrap(video, 'update', self.event('draw', RENDER))
+        self.wrap(navigator, 'test', self.category(CONDITIONS))
+        self.wrap(navigator, 'execute', self.category(STEPS))
+        self.wrap(navigator, 'play', self.category(AUDIO))
+        self.wrap(audio, 'play', self.category(AUDIO))
+        self.wrap(navigator, 'update', self.category(RENDER))
+        self.wrap(video, 'paste', self.category(RENDER))
+
+    def detach(self):
+        """Stop tracing and put the original methods back."""
+        while self.originals:
+            [object, name, had] = self.originals.pop()
+            if had != None:
+                setattr(object, name, had)
+            else:
+                delattr(object, name)
+
+    def wrap(self, object, name, wrapper):
+        self.originals.append([object, name, object.__dict__.get(name)])
+        setattr(object, name, wrapper(getattr(object, name)))
+
+    def event(self, kind, category):
+        def wrapper(method):
+            def traced(*args):
+                if self.current != None:
+                    return method(*args)
+                navigator = self.navigator
+                [page_i, state_i] = [navigator.page_i, navigator.state_i]
+                [self.current, self.times] = [category, [0.0]*5]
+                self.mark = start = clock()
+                try:
+                    return method(*args)
+                finally:
+                    end = clock()
+                    self.times[self.current] = (
+                        self.times[self.current] + end - self.mark)
+                    self.current = None
+                    self.record([kind, (args or [None])[0], page_i, state_i,
+                                 end - start] + self.times)
+            return traced
+        return wrapper
+
+    def category(self, category):
+        def wrapper(method):
+            def traced(*args):
+                if self.current == None:
+                    return method(*args)
+                [outer, now] = [self.current, clock()]
+                self.times[outer] = self.times[outer] + now - self.mark
+                [self.current, self.mark] = [category, now]
+                try:
+                    return method(*args)
+                finally:
+                    now = clock()
+                    self.times[category] = (
+                        self.times[category] + now - self.mark)
+                    [self.current, self.mark] = [outer, now]
+            return traced
+        return wrapper
+
+    def record(self, event):
+        for i in range(4, len(event)):
+            event[i] = int(event[i]*1000000)
+            bucket = min(event[i].bit_length(), BUCKETS - 1)
+            histogram = self.histograms[FIELDS[i]]
+            histogram[bucket] = histogram[bucket] + 1
+        if len(self.events) < self.size:
+            self.events.append(tuple(event))
+        else:
+            self.events[self.next] = tuple(event)
+        self.next = (self.next + 1) % self.size
+
+    def export(self):
+        """Return the traced events, oldest first, and the histograms
+        as a dictionary ready to save as JSON, along with the number of
+        events, total time and worst time for each page.  Times are in
+        microseconds; bucket i of a histogram counts times from 2**(i-1)
+        up to 2**i."""
+        events = self.events[self.next:] + self.events[:self.next]
+        if len(self.events) < self.size:
+            events = self.events[:]
+        pages = {}
+        for event in events:
+            if event[0] != 'draw':
+                [count, total, worst] = pages.get(event[2], [0, 0, 0])
+                pages[event[2]] = [count + 1, total + event[4],
+                                   max(worst, event[4])]
+        return {'fields': FIELDS, 'events': map(list, events),
+                'histograms': self.histograms,
+                'pages': [[page_i] + pages[page_i]
+                          for page_i in sorted(pages)]}
+
+    def save(self, filename):
+        """Write the exported trace to a JSON file."""
+        json.dump(self.export(), open(filename, 'w'))
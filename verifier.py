@@ -1,51 +1,127 @@
-def verify(ballot):
-    [groups, sprites] = [ballot.model.groups, ballot.video.sprites]
-    option_sizes = [[] for group in groups]
-    char_sizes = [[] for group in groups]
+import hmac, multiprocessing, os, sha
+import Ballot
+from SlotMap import SlotMap
+
+VERSION = "Pvote verifier 1"
 
+def verify(ballot):
+    verify_lengths(ballot)
+    [option_sizes, char_sizes] = [[], []]
+    for page_i in range(len(ballot.model.pages)):
+        [options, chars] = verify_page(ballot, page_i)
+        option_sizes.extend(options)
+        char_sizes.extend(chars)
+    verify_groups(ballot, option_sizes, char_sizes)
+    verify_text(ballot)
+    verify_clips(ballot, 0, len(ballot.audio.clips))
+    verify_layouts(ballot)
+    verify_sprites(ballot, 0, len(ballot.video.sprites))
+
+def verify_parallel(ballot, filename, processes=None, chunks=64):
+    global shared
+    verify_lengths(ballot)
+    shared = ballot
+    pool = multiprocessing.Pool(processes, start_worker,
+                                [filename, ballot.sha.digest()])
+    try:
+        [pages, clips] = [len(ballot.model.pages), len(ballot.audio.clips)]
+        sprites = len(ballot.video.sprites)
+        media = [[verify_clips, i, min(i + chunks, clips)]
+                 for i in range(0, clips, chunks)]
+        media = media + [[verify_sprites, i, min(i + chunks, sprites)]
+                         for i in range(0, sprites, chunks)]
+        media_results = pool.map_async(work_media, media)
+        [option_sizes, char_sizes] = [[], []]
+        for [options, chars] in pool.map(work_page, range(pages)):
+            option_sizes.extend(options)
+            char_sizes.extend(chars)
+        verify_groups(ballot, option_sizes, char_sizes)
+        verify_text(ballot)
+        verify_layouts(ballot)
+        media_results.get()
+    finally:
+        pool.close()
+        pool.join()
+        shared = None
+
+shared = None
+settings = None
+
+def start_worker(filename, digest):
+    global settings
+    settings = [filename, digest]
+
+def load_shared():
+    # Forked workers inherit the parent's ballot; spawned ones load the file.
+    global shared
+    if shared == None:
+        [filename, digest] = settings
+        ballot = Ballot.Ballot(Ballot.MappedFile(open(filename, "rb")))
+        assert ballot.sha.digest() == digest
+        shared = ballot
+    return shared
+
+def work_page(page_i):
+    return verify_page(load_shared(), page_i)
+
+def work_media(job):
+    [function, start, stop] = job
+    function(load_shared(), start, stop)
+
+def verify_lengths(ballot):
     assert len(ballot.model.groups) == len(ballot.text.groups) > 0
     assert len(ballot.model.pages) == len(ballot.video.layouts) > 0
 
-    for [page_i, page] in enumerate(ballot.model.pages):
-        layout = ballot.video.layouts[page_i]
+def verify_page(ballot, page_i):
+    [groups, sprites] = [ballot.model.groups, ballot.video.sprites]
+    [page, layout] = [ballot.model.pages[page_i], ballot.video.layouts[page_i]]
+    [option_sizes, char_sizes] = [[], []]
 
-        for binding in page.bindings:
+    for binding in page.bindings:
+        verify_binding(ballot, page, binding)
+    assert len(page.states) > 0
+
+    for [state_i, state] in enumerate(page.states):
+        verify_size(sprites[state.sprite_i], layout.slots[state_i])
+        verify_segments(ballot, page, state.segments)
+        for binding in state.bindings:
             verify_binding(ballot, page, binding)
-        assert len(page.states) > 0
-
-        for [state_i, state] in enumerate(page.states):
-            verify_size(sprites[state.sprite_i], layout.slots[state_i])
-            verify_segments(ballot, page, state.segments)
-            for binding in state.bindings:
-                verify_binding(ballot, page, binding)
-            verify_segments(ballot, page, state.timeout_segments)
-            verify_goto(ballot, state.timeout_page_i, state.timeout_state_i)
-        slot_i = len(page.states)
-
-        for area in page.option_areas:
-            verify_option_ref(ballot, page, area)
-            option_sizes[area.group_i].append(layout.slots[slot_i])
-            slot_i = slot_i + 1
-
-        for area in page.counter_areas:
-            for i in range(groups[area.group_i].max_sels + 1):
-                verify_size(sprites[area.sprite_i + i], layout.slots[slot_i])
-            slot_i = slot_i + 1
-
-        for area in page.review_areas:
-            for i in range(groups[area.group_i].max_sels):
-                option_sizes[area.group_i].append(layout.slots[slot_i])
-                slot_i = slot_i + 1
-                for j in range(groups[area.group_i].max_chars):
-                    char_sizes[area.group_i].append(layout.slots[slot_i])
-                    slot_i = slot_i + 1
-            if area.cursor_sprite_i != None:
-                option_sizes[area.group_i].append(sprites[area.cursor_sprite_i])
+        verify_segments(ballot, page, state.timeout_segments)
+        verify_goto(ballot, state.timeout_page_i, state.timeout_state_i)
+    slots = SlotMap(page, groups)
+    assert slots.count <= len(layout.slots)
+
+    for [area, slot_i] in zip(page.option_areas, slots.options):
+        verify_option_ref(ballot, page, area)
+        option_sizes.append([area.group_i, size(layout.slots[slot_i])])
+
+    for [area, slot_i] in zip(page.counter_areas, slots.counters):
+        for i in range(groups[area.group_i].max_sels + 1):
+            verify_size(sprites[area.sprite_i + i], layout.slots[slot_i])
+
+    for [area, positions] in zip(page.review_areas, slots.reviews):
+        for [slot_i, char_slots] in positions:
+            option_sizes.append([area.group_i, size(layout.slots[slot_i])])
+            for char_slot_i in char_slots:
+                rect = layout.slots[char_slot_i]
+                char_sizes.append([area.group_i, size(rect)])
+        if area.cursor_sprite_i != None:
+            cursor = sprites[area.cursor_sprite_i]
+            option_sizes.append([area.group_i, size(cursor)])
+    return [option_sizes, char_sizes]
+
+def verify_groups(ballot, option_sizes, char_sizes):
+    [groups, sprites] = [ballot.model.groups, ballot.video.sprites]
+    [options, chars] = [[[] for group in groups], [[] for group in groups]]
+    for [group_i, object_size] in option_sizes:
+        options[group_i].append(object_size)
+    for [group_i, object_size] in char_sizes:
+        chars[group_i].append(object_size)
 
     for [group_i, group] in enumerate(groups):
         for option in group.options:
-            option_sizes[group_i].append(sprites[option.sprite_i])
-            option_sizes[group_i].append(sprites[option.sprite_i + 1])
+            options[group_i].append(size(sprites[option.sprite_i]))
+            options[group_i].append(size(sprites[option.sprite_i + 1]))
             assert group.option_clips > 0
             ballot.audio.clips[option.clip_i + group.option_clips - 1]
             if option.writein_group_i != None:
@@ -53,28 +129,33 @@ def verify(ballot):
                 assert writein_group.max_chars == 0
                 assert writein_group.max_sels == group.max_chars > 0
                 for option in writein_group.options:
-                    char_sizes[group_i].append(sprites[option.sprite_i])
-        for object in option_sizes[group_i]:
-            verify_size(object, option_sizes[group_i][0])
-        for object in char_sizes[group_i]:
-            verify_size(object, char_sizes[group_i][0])
+                    chars[group_i].append(size(sprites[option.sprite_i]))
+        for object_size in options[group_i]:
+            assert object_size == options[group_i][0]
+        for object_size in chars[group_i]:
+            assert object_size == chars[group_i][0]
 
+def verify_text(ballot):
     for [group_i, group] in enumerate(ballot.text.groups):
         assert len(group.name) <= 50
-        assert len(group.options) == len(groups[group_i].options)
+        assert len(group.options) == len(ballot.model.groups[group_i].options)
         for option in group.options:
             assert len(option) <= 50
 
-    for clip in ballot.audio.clips:
+def verify_clips(ballot, start, stop):
+    for clip in ballot.audio.clips[start:stop]:
         assert len(clip.samples) > 0
 
+def verify_layouts(ballot):
     assert ballot.video.width*ballot.video.height > 0
     for layout in ballot.video.layouts:
         verify_size(layout.screen, ballot.video)
         for rect in layout.targets + layout.slots:
             assert rect.left + rect.width <= ballot.video.width
             assert rect.top + rect.height <= ballot.video.height
-    for sprite in ballot.video.sprites:
+
+def verify_sprites(ballot, start, stop):
+    for sprite in ballot.video.sprites[start:stop]:
         assert len(sprite.pixels) == sprite.width*sprite.height*3 > 0
 
 def verify_binding(ballot, page, binding):
@@ -110,3 +191,20 @@ def verify_option_ref(ballot, page, object):
 
 def verify_size(a, b):
     assert a.width == b.width and a.height == b.height
+
+def size(object):
+    return [object.width, object.height]
+
+def receipt(ballot, key):
+    return hmac.new(key, VERSION + ballot.sha.digest(), sha).digest()
+
+def verify_cached(ballot, filename, key):
+    assert len(key) > 0
+    expected = receipt(ballot, key)
+    if os.path.exists(filename):
+        if open(filename, "rb").read() == expected:
+            return
+    verify(ballot)
+    file = open(filename, "wb")
+    file.write(expected)
+    file.close()